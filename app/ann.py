@@ -0,0 +1,125 @@
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over L2-normalized vectors.
+
+    Vectors are partitioned by spherical k-means into `nlist` cells. A query is
+    compared against the centroids, and only the vectors in the `nprobe` closest
+    cells are scored exactly. Raising `nprobe` trades speed for recall; with
+    `nprobe == nlist` the search is exact.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, ids: np.ndarray):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: Optional[int] = None, iterations: int = 10,
+              sample_size: int = 100000, seed: int = 0) -> 'IVFIndex':
+        """Cluster the rows of `matrix` and build the inverted lists."""
+        n = len(matrix)
+        nlist = nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+
+        sample = matrix
+        if n > sample_size:
+            sample = matrix[np.sort(rng.choice(n, sample_size, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assign = cls._assign(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            order = np.argsort(assign, kind='stable')
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[~empty]
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts, axis=0)
+            # Re-seed empty cells with random points so every cell stays in use
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assign = cls._assign(matrix, centroids)
+        ids = np.argsort(assign, kind='stable').astype(np.int64)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+        return cls(centroids, offsets, ids)
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        """Nearest centroid (by inner product) of every row, computed in chunks."""
+        assign = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk):
+            block = np.asarray(matrix[start:start + chunk], dtype=np.float32)
+            assign[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def probe(self, matrix: np.ndarray, query: np.ndarray,
+              nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every row of `matrix` in the `nprobe` cells closest to `query`.
+        Returns (ids, scores) in ascending id order.
+        """
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+
+        candidates = np.concatenate([self.ids[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        candidates.sort()
+        return candidates, matrix[candidates] @ query
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int,
+               nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k rows of `matrix` by inner product with `query`.
+        Returns (ids, scores), best first.
+        """
+        candidates, scores = self.probe(matrix, query, nprobe)
+        k = min(k, len(candidates))
+        if k == 0:
+            return candidates[:0], scores[:0]
+        if k < len(candidates):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return candidates[top], scores[top]
+
+    def save(self, path: str, fingerprint: str = ''):
+        """Write the index to `path` (.npz) atomically."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, ids=self.ids,
+                     fingerprint=np.array(fingerprint))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, fingerprint: str = '') -> Optional['IVFIndex']:
+        """Load an index saved by `save`, or None if missing or built for other data."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if str(data['fingerprint']) != fingerprint:
+                    return None
+                return cls(data['centroids'], data['offsets'], data['ids'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: Could not load ANN index: {e}")
+            return None
@@ -0,0 +1,248 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import struct
+import sys
+from collections.abc import Sequence
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MAGIC = b'SHLCATIX'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+class ArtifactError(Exception):
+    """The artifact is missing, corrupt, or was built for another format."""
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class BlobTable(Sequence):
+    """
+    Read-only sequence of variable-length byte records stored back to back,
+    with `offsets[i]:offsets[i + 1]` delimiting record i. Records are sliced
+    out of the mapped file on access; `decode`, if given, is applied to each.
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, decode=None):
+        self.data = data
+        self.offsets = offsets
+        self.decode = decode
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        record = self.data[int(self.offsets[idx]):int(self.offsets[idx + 1])].tobytes()
+        return self.decode(record) if self.decode else record
+
+
+def _blob(records: List[Optional[bytes]]) -> Dict[str, np.ndarray]:
+    """Pack records into data and offsets arrays; None is stored as an empty record."""
+    lengths = [len(record or b'') for record in records]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    data = np.frombuffer(b''.join(record or b'' for record in records), dtype=np.uint8)
+    return {'data': data, 'offsets': offsets}
+
+
+def write_artifact(path: str, snapshot, options: Dict, catalog_stat: Optional[List[int]] = None):
+    """
+    Compile `snapshot` (an AssessmentRecommender CatalogSnapshot) into one
+    binary file at `path`: a header with the format version, catalog version,
+    embedding model, build options and a payload checksum, followed by
+    64-byte aligned sections. `catalog_stat`, the size and mtime of the
+    catalog file `snapshot` was read from, lets loaders skip hashing it.
+    """
+    sections: Dict[str, np.ndarray] = {}
+
+    def add_blob(name, records):
+        packed = _blob(records)
+        sections[name] = packed['data']
+        sections[name + '_offsets'] = packed['offsets']
+
+    add_blob('assessments', [json.dumps(a, ensure_ascii=False).encode('utf-8')
+                             for a in snapshot.assessments])
+    add_blob('fragments', list(snapshot.fragments))
+
+    for name, column in snapshot.catalog.columns().items():
+        sections['catalog_' + name] = column
+
+    sections['keyword_index'] = np.frombuffer(
+        pickle.dumps(snapshot.keyword_index, protocol=pickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+    if snapshot.bm25_index is not None:
+        snapshot.bm25_index.fit()
+        weights = snapshot.bm25_index.weights
+        sections['bm25_data'] = weights.data.astype(np.float32)
+        sections['bm25_indices'] = weights.indices
+        sections['bm25_indptr'] = weights.indptr
+        vocabulary = {term: int(col) for term, col in snapshot.bm25_index.vectorizer.vocabulary_.items()}
+        sections['bm25_vocabulary'] = np.frombuffer(json.dumps(vocabulary).encode('utf-8'), dtype=np.uint8)
+
+    index = snapshot.embedding_index
+    if index is not None:
+        sections['embeddings'] = np.asarray(index.matrix, dtype=np.float32)
+        sections['embedding_missing'] = np.asarray(index.missing, dtype=np.int64)
+        if index.ann is not None:
+            sections['ann_centroids'] = index.ann.centroids
+            sections['ann_offsets'] = index.ann.offsets
+            sections['ann_ids'] = index.ann.ids
+
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        array = np.ascontiguousarray(array)
+        sections[name] = array
+        offset = _align(offset)
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+
+    checksum = hashlib.sha256()
+    for name, array in sections.items():
+        checksum.update(memoryview(array).cast('B'))
+
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'catalog_version': snapshot.version,
+        'catalog_stat': catalog_stat,
+        'model_id': snapshot.backend.model_id if index is not None else '',
+        'count': len(snapshot.assessments),
+        'test_type_bits': snapshot.catalog.test_type_bits,
+        'options': options,
+        'sections': layout,
+        'checksum': checksum.hexdigest(),
+    }).encode('utf-8')
+    payload_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp = path + '.tmp'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, array in sections.items():
+            f.write(b'\0' * (payload_start + layout[name]['offset'] - f.tell()))
+            f.write(memoryview(array).cast('B'))
+    os.replace(tmp, path)
+
+
+class CatalogArtifact:
+    """
+    A catalog artifact opened with a memory map. Sections are numpy views of
+    the mapped file, so opening costs the same whatever the catalog size, and
+    the OS shares the pages between processes serving the same file.
+    """
+
+    def __init__(self, path: str, verify: bool = True):
+        try:
+            with open(path, 'rb') as f:
+                magic = f.read(len(MAGIC))
+                if magic != MAGIC:
+                    raise ArtifactError(f"{path} is not a catalog artifact")
+                (header_len,) = struct.unpack('<Q', f.read(8))
+                self.header = json.loads(f.read(header_len).decode('utf-8'))
+            self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        except (OSError, ValueError, struct.error) as e:
+            raise ArtifactError(f"Could not read {path}: {e}")
+
+        if self.header.get('format') != FORMAT_VERSION:
+            raise ArtifactError(f"{path} has format {self.header.get('format')}, "
+                                f"expected {FORMAT_VERSION}")
+        self.path = path
+        self.payload_start = _align(len(MAGIC) + 8 + header_len)
+        self.sections = self.header['sections']
+        end = max((self.payload_start + section['offset'] +
+                   int(np.prod(section['shape'], dtype=np.int64)) * np.dtype(section['dtype']).itemsize
+                   for section in self.sections.values()), default=0)
+        if len(self.buffer) < end:
+            raise ArtifactError(f"{path} is truncated")
+        if verify:
+            self.verify()
+
+    @property
+    def catalog_version(self) -> str:
+        return self.header['catalog_version']
+
+    @property
+    def catalog_stat(self) -> Optional[List[int]]:
+        return self.header.get('catalog_stat')
+
+    @property
+    def model_id(self) -> str:
+        return self.header['model_id']
+
+    def verify(self):
+        """Check the payload checksum, reading every section once."""
+        checksum = hashlib.sha256()
+        for name in self.sections:
+            checksum.update(memoryview(self.array(name)).cast('B'))
+        if checksum.hexdigest() != self.header['checksum']:
+            raise ArtifactError(f"{self.path} failed its checksum")
+
+    def has(self, name: str) -> bool:
+        return name in self.sections
+
+    def array(self, name: str) -> np.ndarray:
+        """Zero-copy view of a section."""
+        section = self.sections[name]
+        dtype = np.dtype(section['dtype'])
+        count = int(np.prod(section['shape'], dtype=np.int64))
+        start = self.payload_start + section['offset']
+        view = self.buffer[start:start + count * dtype.itemsize].view(dtype)
+        return view.reshape(section['shape'])
+
+    def blob(self, name: str) -> bytes:
+        return self.array(name).tobytes()
+
+    def table(self, name: str, decode=None) -> BlobTable:
+        return BlobTable(self.array(name), self.array(name + '_offsets'), decode)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile the assessment catalog, its embeddings and indexes into one artifact")
+    parser.add_argument('--output', help="artifact path (default: settings.CATALOG_ARTIFACT)")
+    parser.add_argument('--no-embeddings', action='store_true',
+                        help="leave out the embedding index (it is then built at startup)")
+    args = parser.parse_args()
+
+    from app.config import settings
+    from app.recommender import AssessmentRecommender
+
+    output = args.output or settings.CATALOG_ARTIFACT
+    recommender = AssessmentRecommender(load=False)
+    catalog_stat = recommender.catalog_stat()
+    recommender.load_assessments(use_artifact=False)
+    # Changed while it was read: leave the stat out so loaders hash the file
+    if recommender.catalog_stat() != catalog_stat:
+        catalog_stat = None
+    if not recommender.assessments:
+        print("No assessments to compile")
+        sys.exit(1)
+    if not args.no_embeddings:
+        recommender.start_index_build(background=False)
+        if recommender.snapshot.embedding_index is None:
+            print(f"Embedding index unavailable ({recommender.index_status['state']}); "
+                  f"writing the artifact without it")
+
+    write_artifact(output, recommender.snapshot, recommender.artifact_options(), catalog_stat)
+    size_mb = os.path.getsize(output) / 1e6
+    print(f"Wrote {output}: {len(recommender.assessments)} assessments, "
+          f"version {recommender.snapshot.version}, {size_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Balancing categories used by AssessmentRecommender.balance_recommendations
+TECHNICAL = 0
+BEHAVIORAL = 1
+COGNITIVE = 2
+SALES = 3
+OTHER = 4
+
+
+def assessment_category(assessment: Dict) -> int:
+    """Balancing category of an assessment, derived from its test types."""
+    test_types = ' '.join(assessment.get('test_type', [])).lower()
+    if 'knowledge' in test_types or 'skills' in test_types:
+        return TECHNICAL
+    if 'personality' in test_types or 'behavior' in test_types:
+        return BEHAVIORAL
+    if 'ability' in test_types or 'aptitude' in test_types:
+        return COGNITIVE
+    if 'competencies' in test_types and 'sales' in assessment.get('name', '').lower():
+        return SALES
+    return OTHER
+
+
+class Catalog:
+    """
+    Struct-of-arrays view of the assessment catalog.
+
+    Per-assessment attributes are computed once at load into numpy arrays
+    indexed by catalog position, so ranking code can select, bucket and
+    dedupe candidates with index arrays and masks instead of copying dicts.
+    Each distinct test type gets a bit in `type_mask`.
+    """
+
+    COLUMNS = ('duration', 'adaptive', 'remote', 'category', 'type_mask', 'url_id')
+
+    def __init__(self, assessments: List[Dict]):
+        self.assessments = assessments
+        self.size = len(assessments)
+
+        self.duration = np.array([a.get('duration', 60) for a in assessments], dtype=np.int32)
+        self.adaptive = np.array([a.get('adaptive_support', 'No') == 'Yes' for a in assessments], dtype=bool)
+        self.remote = np.array([a.get('remote_support', 'Yes') == 'Yes' for a in assessments], dtype=bool)
+        self.category = np.array([assessment_category(a) for a in assessments], dtype=np.int8)
+
+        test_types = sorted({t for a in assessments for t in a.get('test_type', [])})
+        self.test_type_bits = {name: 1 << bit for bit, name in enumerate(test_types)}
+        self.type_mask = np.array(
+            [sum(self.test_type_bits[t] for t in set(a.get('test_type', []))) for a in assessments],
+            dtype=np.int64
+        )
+
+        # Equal URLs share an id, so duplicates can be dropped with np.unique
+        urls = [a.get('url', '') for a in assessments]
+        _, self.url_id = np.unique(np.array(urls, dtype=object), return_inverse=True)
+        self.url_id = self.url_id.astype(np.int64)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """The per-assessment arrays, by attribute name."""
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    @classmethod
+    def from_columns(cls, assessments, columns: Dict[str, np.ndarray],
+                     test_type_bits: Dict[str, int]) -> 'Catalog':
+        """Rebuild a catalog from arrays saved by `columns`, without scanning `assessments`."""
+        catalog = cls.__new__(cls)
+        catalog.assessments = assessments
+        catalog.size = len(assessments)
+        catalog.test_type_bits = test_type_bits
+        for name in cls.COLUMNS:
+            setattr(catalog, name, columns[name])
+        return catalog
+
+    def filter_mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """
+        Boolean mask of assessments satisfying the structured `filters`, or None
+        when no filter is set. Supported keys: max_duration, required_test_types
+        (at least one of them), excluded_test_types (none of them),
+        remote_support and adaptive_support. Test type names are case-insensitive.
+        """
+        if not filters:
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+        bits = {name.lower(): bit for name, bit in self.test_type_bits.items()}
+
+        def type_bits(names):
+            combined = 0
+            for name in names:
+                combined |= bits.get(name.lower(), 0)
+            return combined
+
+        if filters.get('max_duration') is not None:
+            mask &= self.duration <= filters['max_duration']
+        if filters.get('required_test_types'):
+            mask &= (self.type_mask & type_bits(filters['required_test_types'])) != 0
+        if filters.get('excluded_test_types'):
+            mask &= (self.type_mask & type_bits(filters['excluded_test_types'])) == 0
+        if filters.get('remote_support') is not None:
+            mask &= self.remote == filters['remote_support']
+        if filters.get('adaptive_support') is not None:
+            mask &= self.adaptive == filters['adaptive_support']
+        return mask
+
+    def materialize(self, indices: np.ndarray, scores: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Copies of the assessments at `indices`, each with its catalog position
+        as `_index` and, when `scores` are given, its `_score`.
+        """
+        results = []
+        for idx in indices:
+            assessment = self.assessments[idx].copy()
+            assessment['_index'] = int(idx)
+            if scores is not None:
+                assessment['_score'] = float(scores[idx])
+            results.append(assessment)
+        return results
@@ -0,0 +1,100 @@
+import threading
+import time
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for calls to an upstream service.
+
+    Closed, calls go through. After `failure_threshold` consecutive failures
+    or calls slower than `slow_call_seconds`, it opens and `allow()` refuses
+    every call, so callers take their fallback immediately instead of waiting
+    for the upstream to time out. After `reset_timeout` seconds one probe call
+    is let through (half-open): success closes the breaker, failure opens it
+    again for another `reset_timeout`.
+
+    It also keeps a moving average of successful call latency, which callers
+    use to skip calls that would not finish within their deadline.
+    """
+
+    def __init__(self, failure_threshold: int = 5, slow_call_seconds: float = 2.0,
+                 reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.latency = 0.0
+        self.rejected = 0
+        self.skipped = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go ahead now. A caller that is allowed must report
+        the outcome with record_success or record_failure, or call release if
+        it does not make the call.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Report that a call allowed by allow() was not made after all."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self, seconds: float):
+        if seconds >= self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            self.latency = seconds if not self.latency else 0.8 * self.latency + 0.2 * seconds
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                print("Circuit breaker closed: upstream recovered")
+            self.state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    print(f"Circuit breaker open after {self.failures} failed or slow calls")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def fits(self, deadline: float) -> bool:
+        """
+        Whether a typical call would finish before `deadline` (time.monotonic);
+        calls that would not are counted as skipped.
+        """
+        if time.monotonic() + self.latency < deadline:
+            return True
+        self.skipped += 1
+        return False
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "skipped": self.skipped,
+            "latency_ms": round(self.latency * 1000, 1),
+        }
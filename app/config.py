@@ -12,6 +12,84 @@ class Settings:
     TEST_FILE = os.path.join(DATA_DIR, "test_set.csv")
     MIN_RECOMMENDATIONS = 5
     MAX_RECOMMENDATIONS = 10
+    MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "100"))
+    # "gemini" calls the Gemini API; "local" fits TF-IDF + SVD on the catalog
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "gemini")
     EMBEDDING_MODEL = "models/embedding-001"
+    LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "256"))
+    EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR", os.path.join(DATA_DIR, "embeddings"))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+    EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1.0"))
+    # The embedding index is only used once EMBEDDING_MIN_COVERAGE of the catalog
+    # is embedded; embeddings that failed every retry are tried again in the
+    # background, every EMBEDDING_BACKFILL_SECONDS doubling up to the max
+    EMBEDDING_MIN_COVERAGE = float(os.getenv("EMBEDDING_MIN_COVERAGE", "0.9"))
+    EMBEDDING_BACKFILL_SECONDS = float(os.getenv("EMBEDDING_BACKFILL_SECONDS", "30"))
+    EMBEDDING_BACKFILL_MAX_SECONDS = float(os.getenv("EMBEDDING_BACKFILL_MAX_SECONDS", "600"))
+    # Circuit breaker around query embedding calls: it opens after BREAKER_FAILURES
+    # consecutive failed calls or calls slower than BREAKER_SLOW_SECONDS, and lets
+    # a probe through after BREAKER_RESET_SECONDS. Each /recommend request gives its
+    # embedding call at most REQUEST_DEADLINE_MS (0 disables the deadline)
+    BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+    BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", "2.0"))
+    BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+    REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", "1500"))
+    # Query embeddings for remote backends that arrive within EMBEDDING_BATCH_WINDOW_MS
+    # of each other (up to EMBEDDING_MAX_BATCH) are sent in one call (0 disables);
+    # API calls are limited to EMBEDDING_RPM per minute, in bursts of up to
+    # EMBEDDING_BURST (0 disables the limit)
+    EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+    EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+    EMBEDDING_RPM = float(os.getenv("EMBEDDING_RPM", "1500"))
+    EMBEDDING_BURST = float(os.getenv("EMBEDDING_BURST", "20"))
+    # "vector" ranks by embeddings and falls back to the lexical engine;
+    # "lexical" always uses the lexical engine ("keyword" or "bm25");
+    # "hybrid" fuses both rankings with reciprocal-rank fusion
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+    LEXICAL_ENGINE = os.getenv("LEXICAL_ENGINE", "keyword")
+    HYBRID_BUDGET_MS = float(os.getenv("HYBRID_BUDGET_MS", "1000"))
+    HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+    HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+    HYBRID_DEPTH = int(os.getenv("HYBRID_DEPTH", "50"))
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+    BM25_B = float(os.getenv("BM25_B", "0.75"))
+    BM25_NAME_WEIGHT = float(os.getenv("BM25_NAME_WEIGHT", "3.0"))
+    BM25_DESCRIPTION_WEIGHT = float(os.getenv("BM25_DESCRIPTION_WEIGHT", "1.0"))
+    BM25_TEST_TYPE_WEIGHT = float(os.getenv("BM25_TEST_TYPE_WEIGHT", "2.0"))
+    # Catalogs with at least ANN_MIN_SIZE items are searched with an IVF index;
+    # ANN_NLIST=0 picks 4*sqrt(N) cells, ANN_NPROBE trades speed for recall
+    ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", "5000"))
+    ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+    ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+    # Thread pools used by the async request path: network-bound embedding
+    # calls (and the hybrid vector leg) run on the I/O pool, scoring on the CPU pool
+    IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+    CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(os.cpu_count() or 2)))
+    # Share one computation between concurrent identical /recommend requests
+    SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+    # Serialized /recommend responses, keyed by request and index version
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    # Catalog reload: POST /admin/reload with X-Admin-Token, and/or polling the
+    # assessments file every CATALOG_WATCH_INTERVAL seconds (0 disables)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    CATALOG_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "0"))
+    # Target time from process start until /health answers (cold starts are
+    # user-facing on hosts that sleep idle instances)
+    STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "3.0"))
+    # Log the stage breakdown of /recommend requests slower than SLOW_REQUEST_MS
+    # (0 disables), for a SLOW_REQUEST_SAMPLE_RATE fraction of them
+    SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+    SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("SLOW_REQUEST_SAMPLE_RATE", "1.0"))
+    # Prebuilt catalog artifact (python -m app.artifact), memory-mapped at startup
+    # when it matches the catalog file; ARTIFACT_VERIFY checks its payload checksum,
+    # which reads the whole file
+    CATALOG_ARTIFACT = os.getenv("CATALOG_ARTIFACT", os.path.join(DATA_DIR, "catalog.idx"))
+    ARTIFACT_VERIFY = os.getenv("ARTIFACT_VERIFY", "false").lower() == "true"
     
 settings = Settings()
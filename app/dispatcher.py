@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+
+class EmbeddingDispatcher:
+    """
+    Micro-batches concurrent query embeddings for remote backends.
+
+    Callers submit one text and wait for its vector. A worker thread collects
+    the texts that arrive within `window` seconds of the first one, or until
+    `max_batch` are waiting, and sends them (deduplicated) with a single
+    `embed_queries` call on a pool of `concurrency` threads, so several
+    batches can be in flight at once. When all of them are busy, arriving
+    texts wait and go out together in the next batch. Each caller waits at
+    most until its own deadline; a late vector still completes the batch
+    for the others.
+    """
+
+    def __init__(self, window: float, max_batch: int, concurrency: int = 4):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.queries = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._worker = None
+        self._slots = threading.Semaphore(max(1, concurrency))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency),
+                                        thread_name_prefix="embedding-batch")
+
+    def embed(self, backend, text: str, deadline: Optional[float] = None) -> Optional[List[float]]:
+        """Embed `text` as part of the next batch; None on failure or past `deadline`."""
+        future = Future()
+        with self._cond:
+            self._pending.append((backend, text, deadline, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-dispatch", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            return None
+
+    def _run(self):
+        while True:
+            # While every call slot is busy, texts keep queueing into a bigger batch
+            self._slots.acquire()
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                flush_at = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = flush_at - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                # One backend per call; texts for another one (after a reload) wait
+                backend = self._pending[0][0]
+                batch = [item for item in self._pending if item[0] is backend][:self.max_batch]
+                taken = set(map(id, batch))
+                self._pending = [item for item in self._pending if id(item) not in taken]
+            self._pool.submit(self._dispatch, batch)
+
+    def _dispatch(self, items: List[tuple]):
+        backend = items[0][0]
+        texts = list(dict.fromkeys(text for _, text, _, _ in items))
+        deadlines = [deadline for _, _, deadline, _ in items]
+        # The call may run until the last caller gives up
+        deadline = None if None in deadlines else max(deadlines)
+        try:
+            vectors = backend.embed_queries(texts, deadline)
+        except Exception as e:
+            print(f"Error embedding batch of {len(texts)} queries: {e}")
+            vectors = {}
+        finally:
+            self._slots.release()
+        position = {text: pos for pos, text in enumerate(texts)}
+        for _, text, _, future in items:
+            future.set_result(vectors.get(position[text]))
+        self.batches += 1
+        self.queries += len(items)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "batched_queries": self.queries,
+            "avg_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
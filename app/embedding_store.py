@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    On-disk, content-addressed store of assessment embeddings.
+
+    Vectors are keyed by a hash of the embedded text and the embedding model,
+    and kept as one contiguous float32 matrix that is memory-mapped on load.
+    Unchanged assessments therefore reuse their vectors across restarts and
+    only new or edited ones need to be embedded again. The files are read on
+    the first lookup, so a store that is never used costs nothing.
+    """
+
+    def __init__(self, directory: str, model: str):
+        self.directory = directory
+        self.model = model
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model).strip('_')
+        self.matrix_path = os.path.join(directory, f"{slug}.npy")
+        self.keys_path = os.path.join(directory, f"{slug}.keys.json")
+        self.keys = []
+        self.matrix = None
+        self._rows = {}
+        self._loaded = False
+
+    def content_key(self, text: str) -> str:
+        """Hash identifying an embedding of `text` produced by this store's model."""
+        digest = hashlib.sha256()
+        digest.update(self.model.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def load(self):
+        """Memory-map the stored matrix, ignoring missing or inconsistent files."""
+        self._loaded = True
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.keys_path)):
+            return
+        try:
+            with open(self.keys_path, 'r', encoding='utf-8') as f:
+                keys = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load embedding store: {e}")
+            return
+        if matrix.ndim != 2 or matrix.shape[0] != len(keys) or matrix.dtype != np.float32:
+            print("Warning: Embedding store is inconsistent, ignoring it")
+            return
+        self.keys = keys
+        self.matrix = matrix
+        self._rows = {key: row for row, key in enumerate(keys)}
+        print(f"Loaded {len(keys)} stored embeddings")
+
+    def lookup(self, keys: List[str]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        Return stored vectors for `keys` and the positions that have none.
+
+        The matrix is None when nothing is stored yet. When every key is stored
+        in the same order, the memory-mapped matrix is returned without copying.
+        """
+        if not self._loaded:
+            self.load()
+        if self.matrix is None:
+            return None, list(range(len(keys)))
+        if keys == self.keys:
+            return self.matrix, []
+
+        matrix = np.zeros((len(keys), self.matrix.shape[1]), dtype=np.float32)
+        missing = []
+        for pos, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is None:
+                missing.append(pos)
+            else:
+                matrix[pos] = self.matrix[row]
+        return matrix, missing
+
+    def save(self, keys: List[str], matrix: np.ndarray):
+        """Replace the stored vectors with `matrix`, one row per key."""
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to temporary files first so a crash never leaves a torn store
+        tmp_matrix = self.matrix_path + '.tmp'
+        tmp_keys = self.keys_path + '.tmp'
+        with open(tmp_matrix, 'wb') as f:
+            np.save(f, matrix)
+        with open(tmp_keys, 'w', encoding='utf-8') as f:
+            json.dump(keys, f)
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_keys, self.keys_path)
+
+        self._loaded = True
+        self.keys = list(keys)
+        self.matrix = matrix
+        self._rows = {key: row for row, key in enumerate(self.keys)}
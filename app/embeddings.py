@@ -0,0 +1,364 @@
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+from app.circuit_breaker import CircuitBreaker
+from app.config import settings
+from app.metrics import EMBEDDING_CALLS
+from app.rate_limit import TokenBucket
+
+# google.generativeai and scikit-learn take seconds to import, so they are
+# imported by the backend that needs them, on first use, to keep cold starts fast
+
+
+class EmbeddingBackend:
+    """
+    Interface for turning text into embedding vectors.
+
+    `model_id` identifies the vector space; vectors from different model ids
+    are never mixed in the embedding store. Backends whose model is fitted on
+    the catalog in `prepare` set `catalog_dependent`, and a new instance is
+    prepared for each catalog version.
+    """
+
+    name = "base"
+    model_id = ""
+    enabled = False
+    catalog_dependent = False
+    # Query embeddings of remote backends are micro-batched (see EmbeddingDispatcher)
+    remote = False
+
+    def prepare(self, texts: List[str]):
+        """Called with the catalog texts once they are loaded."""
+
+    def restore(self, model_id: str) -> bool:
+        """
+        Prepare for a catalog loaded from a prebuilt artifact, whose vectors came
+        from `model_id`. Returns False if this backend cannot produce that model.
+        """
+        return model_id == self.model_id
+
+    def embed_query(self, text: str, deadline: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Embed a single query, returning None on failure. Remote backends give up
+        (return None) rather than run past `deadline`, a time.monotonic() value.
+        """
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str], on_progress=None) -> Dict[int, List[float]]:
+        """
+        Embed many texts, returning vectors by position; items that could not be
+        embedded are left out. `on_progress`, if given, is called with the
+        number of new vectors as they complete.
+        """
+        raise NotImplementedError
+
+    def embed_queries(self, texts: List[str], deadline: Optional[float] = None) -> Dict[int, List[float]]:
+        """Embed many queries at once, with the same contract as embed_documents."""
+        return self.embed_documents(texts)
+
+    def stats(self) -> Dict:
+        """Health of the upstream service, for the readiness endpoint."""
+        return {}
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """
+    Embeddings from the Gemini API.
+
+    Query embeddings, which sit on the request path, go through a circuit
+    breaker: while the API is failing or slow they return None at once and
+    the caller falls back to lexical matching. Catalog builds are not
+    guarded; they retry with backoff instead (see embed_documents).
+    """
+
+    name = "gemini"
+    remote = True
+
+    def __init__(self):
+        self.model_id = settings.EMBEDDING_MODEL
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Older google-generativeai releases (e.g. 0.3.x) take no request_options
+        self._request_options = False
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.BREAKER_FAILURES,
+            slow_call_seconds=settings.BREAKER_SLOW_SECONDS,
+            reset_timeout=settings.BREAKER_RESET_SECONDS,
+        )
+        # Calls with a deadline run here, so the caller can stop waiting at the
+        # deadline even on client releases that take no timeout
+        self._calls = ThreadPoolExecutor(max_workers=max(1, settings.IO_POOL_SIZE),
+                                         thread_name_prefix="gemini-call")
+        # Shared by query and catalog build calls, to stay within the API quota
+        self.rate_limiter = TokenBucket(settings.EMBEDDING_RPM / 60, settings.EMBEDDING_BURST)
+        if settings.GOOGLE_API_KEY and settings.GOOGLE_API_KEY.strip():
+            self.enabled = True
+        else:
+            print("Warning: GOOGLE_API_KEY not set. Using keyword-based recommendations.")
+
+    def client(self):
+        """The google.generativeai module, imported and configured on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    try:
+                        import google.generativeai as genai
+                        genai.configure(api_key=settings.GOOGLE_API_KEY)
+                    except Exception as e:
+                        print(f"Warning: Could not configure Gemini API: {e}")
+                        print("Falling back to keyword-based recommendations")
+                        self.enabled = False
+                        raise
+                    print("Gemini API configured successfully")
+                    params = inspect.signature(genai.embed_content).parameters
+                    self._request_options = "request_options" in params
+                    self._client = genai
+        return self._client
+
+    def guarded(self, call, deadline: Optional[float] = None):
+        """
+        Run `call(request_options)` through the circuit breaker, with the time
+        left before `deadline` as its timeout. Returns None when the breaker is
+        open, when a typical call or the rate limit would not let it finish in
+        time, or on failure. An open breaker is checked first, so rejected
+        calls neither take nor wait for a rate limit token. A call still running
+        at `deadline` is abandoned and counted as a breaker failure right away.
+        """
+        if deadline is not None and not self.breaker.fits(deadline):
+            EMBEDDING_CALLS.inc("skipped")
+            return None
+        if not self.breaker.allow():
+            EMBEDDING_CALLS.inc("rejected")
+            return None
+        if not self.rate_limiter.acquire(deadline):
+            # Let another call be the half-open probe
+            self.breaker.release()
+            EMBEDDING_CALLS.inc("throttled")
+            return None
+        request_options = None
+        if deadline is not None:
+            request_options = {"timeout": max(0.001, deadline - time.monotonic())}
+        start = time.monotonic()
+        try:
+            if deadline is None:
+                result = call(request_options)
+            else:
+                future = self._calls.submit(call, request_options)
+                result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            self.breaker.record_failure()
+            EMBEDDING_CALLS.inc("timeout")
+            print("Embedding call did not finish before its deadline")
+            return None
+        except Exception as e:
+            self.breaker.record_failure()
+            EMBEDDING_CALLS.inc("error")
+            print(f"Error getting embedding: {e}")
+            return None
+        self.breaker.record_success(time.monotonic() - start)
+        EMBEDDING_CALLS.inc("ok")
+        return result
+
+    def embed_query(self, text: str, deadline: Optional[float] = None) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+
+        # On failure the caller falls back to keyword matching
+        result = self.guarded(
+            lambda request_options: self.embed_content(text, request_options), deadline)
+        return result['embedding'] if result is not None else None
+
+    def embed_queries(self, texts: List[str], deadline: Optional[float] = None) -> Dict[int, List[float]]:
+        """
+        Embed queries in batches through the circuit breaker, without retries;
+        queries in batches that failed or were skipped are left out.
+        """
+        if not self.enabled:
+            return {}
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        vectors = {}
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            embeddings = self.guarded(
+                lambda request_options: self.embed_batch(batch, request_options), deadline)
+            if embeddings is None:
+                break
+            for offset, emb in enumerate(embeddings):
+                vectors[start + offset] = emb
+        return vectors
+
+    def embed_content(self, content, request_options: Optional[Dict] = None) -> Dict:
+        """
+        One embed_content call. The timeout in `request_options` is only passed
+        to client releases that accept it; with older ones the caller's deadline
+        still bounds how long it waits (see EmbeddingDispatcher).
+        """
+        client = self.client()
+        kwargs = {}
+        if request_options and self._request_options:
+            kwargs["request_options"] = request_options
+        return client.embed_content(
+            model=self.model_id,
+            content=content,
+            task_type="retrieval_document",
+            **kwargs
+        )
+
+    def embed_batch(self, texts: List[str], request_options: Optional[Dict] = None) -> List[List[float]]:
+        """
+        Embed several texts with a single Gemini API call.
+        Raises on failure so callers can retry.
+        """
+        result = self.embed_content(texts, request_options)
+        embeddings = result['embedding']
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+    def embed_document_batch(self, texts: List[str]) -> List[List[float]]:
+        """embed_batch for catalog builds, waiting as long as the rate limit requires."""
+        self.rate_limiter.acquire()
+        return self.embed_batch(texts)
+
+    def embed_documents(self, texts: List[str], on_progress=None) -> Dict[int, List[float]]:
+        """
+        Embed many texts using batched, concurrent API calls.
+
+        Failed batches are retried with exponential backoff, split in half each
+        time so a single bad item cannot sink its neighbours.
+        """
+        batch_size = max(1, settings.EMBEDDING_BATCH_SIZE)
+        pending = [list(range(start, min(start + batch_size, len(texts))))
+                   for start in range(0, len(texts), batch_size)]
+        vectors = {}
+        attempt = 0
+
+        with ThreadPoolExecutor(max_workers=max(1, settings.EMBEDDING_CONCURRENCY)) as pool:
+            while pending:
+                futures = [(batch, pool.submit(self.embed_document_batch, [texts[i] for i in batch]))
+                           for batch in pending]
+                retry_queue = []
+                for batch, future in futures:
+                    try:
+                        for pos, emb in zip(batch, future.result()):
+                            vectors[pos] = emb
+                        if on_progress:
+                            on_progress(len(batch))
+                    except Exception as e:
+                        print(f"Error embedding batch of {len(batch)}: {e}")
+                        retry_queue.append(batch)
+
+                if not retry_queue:
+                    break
+                if attempt >= settings.EMBEDDING_MAX_RETRIES:
+                    failed = sum(len(batch) for batch in retry_queue)
+                    print(f"Warning: Giving up on {failed} embeddings after {attempt} retries")
+                    break
+
+                time.sleep(settings.EMBEDDING_RETRY_BACKOFF * (2 ** attempt))
+                attempt += 1
+                pending = []
+                for batch in retry_queue:
+                    mid = (len(batch) + 1) // 2
+                    pending.extend(part for part in (batch[:mid], batch[mid:]) if part)
+
+        return vectors
+
+    def stats(self) -> Dict:
+        return {**self.breaker.stats(), **self.rate_limiter.stats()}
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    In-process embeddings: TF-IDF followed by truncated SVD (latent semantic
+    analysis), fitted on the catalog. The fitted model is pickled next to the
+    embedding store and reused while the catalog text is unchanged.
+    """
+
+    name = "local"
+    catalog_dependent = True
+
+    def __init__(self, directory: str, dimensions: int):
+        self.directory = directory
+        self.dimensions = dimensions
+        self.pipeline = None
+
+    def prepare(self, texts: List[str]):
+        if not texts:
+            return
+
+        fingerprint = hashlib.sha256('\n'.join(texts).encode('utf-8')).hexdigest()[:16]
+        model_id = f"local-lsa-{self.dimensions}-{fingerprint}"
+        path = os.path.join(self.directory, f"{model_id}.pkl")
+
+        if not self.load(model_id):
+            from sklearn.decomposition import TruncatedSVD
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.pipeline import make_pipeline
+
+            tfidf = TfidfVectorizer(stop_words='english', sublinear_tf=True)
+            n_features = len(tfidf.fit(texts).vocabulary_)
+            components = max(1, min(self.dimensions, len(texts) - 1, n_features - 1))
+            self.pipeline = make_pipeline(tfidf, TruncatedSVD(n_components=components, random_state=0))
+            self.pipeline.fit(texts)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path, 'wb') as f:
+                    pickle.dump(self.pipeline, f)
+            except OSError as e:
+                print(f"Warning: Could not save local embedding model: {e}")
+
+        self.model_id = model_id
+        self.enabled = True
+        print("Local embedding model ready")
+
+    def load(self, model_id: str) -> bool:
+        """Load the pickled model for `model_id`, if it has been fitted before."""
+        path = os.path.join(self.directory, f"{model_id}.pkl")
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                self.pipeline = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+            print(f"Warning: Could not load local embedding model: {e}")
+            return False
+        return True
+
+    def restore(self, model_id: str) -> bool:
+        if not model_id.startswith(f"local-lsa-{self.dimensions}-") or not self.load(model_id):
+            return False
+        self.model_id = model_id
+        self.enabled = True
+        print("Local embedding model ready")
+        return True
+
+    def embed_query(self, text: str, deadline: Optional[float] = None) -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        vector = self.pipeline.transform([text])[0]
+        # No overlap with the catalog vocabulary: let the caller use the lexical path
+        if not vector.any():
+            return None
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str], on_progress=None) -> Dict[int, List[float]]:
+        if not self.enabled or not texts:
+            return {}
+        vectors = self.pipeline.transform(texts)
+        if on_progress:
+            on_progress(len(texts))
+        return {pos: vector.tolist() for pos, vector in enumerate(vectors)}
+
+
+def create_embedding_backend(name: str) -> EmbeddingBackend:
+    """Instantiate the embedding backend selected by `name` ("gemini" or "local")."""
+    if name == "local":
+        return LocalEmbeddingBackend(settings.EMBEDDINGS_DIR, settings.LOCAL_EMBEDDING_DIM)
+    return GeminiEmbeddingBackend()
@@ -0,0 +1,141 @@
+import bisect
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# Key technical terms
+TECH_KEYWORDS = {'java', 'python', 'sql', 'javascript', 'css', 'html', 'selenium',
+                 'excel', 'tableau', 'data', 'analyst', 'developer', 'engineer',
+                 'testing', 'qa', 'automation', 'programming'}
+
+# Behavioral terms
+BEHAVIORAL_KEYWORDS = {'leadership', 'communication', 'personality', 'behavioral',
+                       'collaborate', 'team', 'management', 'cultural', 'fit',
+                       'interpersonal', 'sales', 'customer', 'service'}
+
+# Role terms
+ROLE_KEYWORDS = {'senior', 'junior', 'entry', 'level', 'manager', 'director',
+                 'executive', 'analyst', 'consultant', 'admin', 'assistant'}
+
+# (pattern, is_hours) tried in order; the last one also matches hour ranges
+DURATION_PATTERNS = [
+    (re.compile(r'(\d+)\s*(?:minutes?|mins?)'), False),
+    (re.compile(r'(\d+)\s*(?:hours?|hrs?)'), True),
+    (re.compile(r'(\d+)-(\d+)\s*(?:minutes?|mins?|hours?|hrs?)'), True),
+]
+
+
+def parse_duration(query_lower: str) -> Optional[int]:
+    """Extract a requested duration in minutes from a lowercased query."""
+    for pattern, is_hours in DURATION_PATTERNS:
+        matches = pattern.findall(query_lower)
+        if matches:
+            first = matches[0]
+            minutes = int(first[0] if isinstance(first, tuple) else first)
+            return minutes * 60 if is_hours else minutes
+    return None
+
+
+class KeywordIndex:
+    """
+    Inverted index over the catalog for keyword-based scoring.
+
+    Everything that does not depend on the query is computed once: lowercased
+    fields, a token -> assessment postings map, per-keyword substring bonuses,
+    durations sorted for range lookups and test-type categories. A query then
+    only visits assessments it can actually score.
+    """
+
+    def __init__(self, assessments: List[Dict], texts: List[str]):
+        self.size = len(assessments)
+        self.postings = defaultdict(list)
+        self.tech_bonus = {}
+        self.behavioral_bonus = {}
+        self.role_bonus = {}
+
+        names = [a.get('name', '').lower() for a in assessments]
+        descriptions = [a.get('description', '').lower() for a in assessments]
+        texts = [text.lower() for text in texts]
+
+        for idx, text in enumerate(texts):
+            for token in set(text.split()):
+                self.postings[token].append(idx)
+
+        def tiered(keyword, name_points, desc_points, text_points):
+            bonus = {}
+            for idx in range(self.size):
+                if keyword in names[idx]:
+                    bonus[idx] = name_points
+                elif keyword in descriptions[idx]:
+                    bonus[idx] = desc_points
+                elif text_points and keyword in texts[idx]:
+                    bonus[idx] = text_points
+            return bonus
+
+        for keyword in TECH_KEYWORDS:
+            self.tech_bonus[keyword] = tiered(keyword, 5, 3, 1)
+        for keyword in BEHAVIORAL_KEYWORDS:
+            self.behavioral_bonus[keyword] = tiered(keyword, 4, 2, 1)
+        for keyword in ROLE_KEYWORDS:
+            self.role_bonus[keyword] = tiered(keyword, 2, 2, 0)
+
+        by_duration = sorted(range(self.size), key=lambda i: assessments[i].get('duration', 60))
+        self.duration_order = by_duration
+        self.sorted_durations = [assessments[i].get('duration', 60) for i in by_duration]
+
+        self.knowledge_types = []
+        self.personality_types = []
+        self.ability_types = []
+        for idx, assessment in enumerate(assessments):
+            test_types = ' '.join(assessment.get('test_type', [])).lower()
+            if 'knowledge' in test_types or 'skill' in test_types:
+                self.knowledge_types.append(idx)
+            if 'personality' in test_types or 'behavior' in test_types:
+                self.personality_types.append(idx)
+            if 'ability' in test_types or 'aptitude' in test_types:
+                self.ability_types.append(idx)
+
+    def _add_duration_boost(self, scores: Dict[int, int], duration: int):
+        """+3 within 15 minutes of the requested duration, +1 within 30."""
+        lo = bisect.bisect_left(self.sorted_durations, duration - 30)
+        hi = bisect.bisect_right(self.sorted_durations, duration + 30)
+        for pos in range(lo, hi):
+            diff = abs(self.sorted_durations[pos] - duration)
+            scores[self.duration_order[pos]] += 3 if diff <= 15 else 1
+
+    def score(self, query: str) -> Dict[int, int]:
+        """Return the positive keyword score of every matching assessment."""
+        query_lower = query.lower()
+        query_words = set(query_lower.split())
+        scores = defaultdict(int)
+
+        # Base overlap score
+        for word in query_words:
+            for idx in self.postings.get(word, ()):
+                scores[idx] += 1
+
+        # Keyword boosts
+        for bonuses, keywords in ((self.tech_bonus, TECH_KEYWORDS),
+                                  (self.behavioral_bonus, BEHAVIORAL_KEYWORDS),
+                                  (self.role_bonus, ROLE_KEYWORDS)):
+            for keyword in query_words & keywords:
+                for idx, points in bonuses[keyword].items():
+                    scores[idx] += points
+
+        # Duration match (within reasonable range)
+        duration = parse_duration(query_lower)
+        if duration:
+            self._add_duration_boost(scores, duration)
+
+        # Test type match
+        if 'knowledge' in query_lower or 'skill' in query_lower or 'technical' in query_lower:
+            for idx in self.knowledge_types:
+                scores[idx] += 3
+        if 'personality' in query_lower or 'behavioral' in query_lower or 'culture' in query_lower:
+            for idx in self.personality_types:
+                scores[idx] += 3
+        if 'cognitive' in query_lower or 'aptitude' in query_lower:
+            for idx in self.ability_types:
+                scores[idx] += 3
+
+        return scores
@@ -1,10 +1,25 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# Measured from here to the end of module setup for the startup report
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from app.models import QueryRequest, RecommendationResponse, HealthResponse, AssessmentResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from app.models import (QueryRequest, BatchQueryRequest, RecommendationResponse, BatchRecommendationResponse,
+                        HealthResponse, ReadyResponse)
 from app.recommender import AssessmentRecommender
+from app.startup import process_age
+from app.cache import LRUCache, etag_matches, make_etag
+from app.metrics import CONTENT_TYPE, REQUEST_SECONDS, Collected, render_metrics
+from app.tracing import log_if_slow, server_timing, start_trace
 from app.config import settings
+from typing import Dict, Optional, Tuple
+import asyncio
+import functools
+import hmac
+import json
 import os
 
 app = FastAPI(
@@ -25,8 +40,54 @@ app.add_middleware(
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Initialize recommender
-recommender = AssessmentRecommender()
+# Initialize recommender; the catalog is loaded at startup
+recommender = AssessmentRecommender(load=False)
+
+# Serialized /recommend responses as (body, etag), keyed by request and index version
+response_cache = LRUCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL)
+
+def cache_counts() -> dict:
+    counts = {}
+    for name, cache in (("query_embeddings", recommender.query_cache), ("responses", response_cache)):
+        stats = cache.stats()
+        counts[(name, "hit")] = stats["hits"]
+        counts[(name, "miss")] = stats["misses"]
+    return counts
+
+# Read when /metrics is scraped, from counters the application keeps anyway
+Collected("shl_cache_requests_total", "Cache lookups by cache and result.", "counter",
+          cache_counts, labels=("cache", "result"))
+Collected("shl_catalog_assessments", "Assessments in the serving catalog.", "gauge",
+          lambda: {(): len(recommender.assessments) if recommender.snapshot else 0})
+Collected("shl_embedding_index_ready", "1 when the embedding index is serving requests.", "gauge",
+          lambda: {(): int(recommender.index_status["state"] == "ready")})
+Collected("shl_embedding_breaker_open", "1 while the embedding circuit breaker is not closed.", "gauge",
+          lambda: {(): int(recommender.backend.stats().get("state", "closed") != "closed")
+                   if recommender.snapshot else 0})
+Collected("shl_single_flight_coalesced_total", "Requests that shared an in-flight computation.",
+          "counter", lambda: {(): recommender.single_flight.coalesced})
+
+recommender.startup.record("import", time.perf_counter() - _import_start)
+
+@app.on_event("startup")
+async def start_index_build():
+    """
+    Load the catalog, then warm up the embedding index in the background so
+    startup is not blocked. Logs the startup phase timings and warns when
+    the process took longer than STARTUP_BUDGET_SECONDS to start serving.
+    """
+    recommender.load_assessments()
+    recommender.start_index_build()
+    if settings.CATALOG_WATCH_INTERVAL > 0:
+        recommender.watch_catalog(settings.CATALOG_WATCH_INTERVAL)
+    
+    age = process_age()
+    if age is not None:
+        recommender.startup.record("process_to_serving", age)
+    print(f"Startup: {recommender.startup.report()}")
+    if age is not None and age > settings.STARTUP_BUDGET_SECONDS:
+        print(f"Warning: serving started {age:.2f}s after process start, "
+              f"over the {settings.STARTUP_BUDGET_SECONDS:.1f}s budget")
 
 @app.get("/", response_class=FileResponse)
 async def root():
@@ -42,17 +103,101 @@ async def health_check():
     """
     return HealthResponse(status="healthy")
 
+@app.get("/ready", response_model=ReadyResponse)
+async def readiness_check():
+    """
+    Report progress of the embedding index build, the startup phase timings
+    and the embedding upstream's circuit breaker.
+    Requests are served by keyword matching until the index is ready.
+    """
+    status = recommender.index_status
+    return ReadyResponse(ready=status["state"] == "ready", startup=recommender.startup.phases,
+                         upstream={**recommender.backend.stats(), **recommender.dispatcher.stats()},
+                         **status)
+
+def build_response(recommendations, filters, snapshot) -> bytes:
+    """
+    Pad recommendations to the minimum count and render the RecommendationResponse
+    JSON from the pre-rendered assessment fragments of `snapshot`, the catalog
+    snapshot the recommendations were computed on.
+    """
+    # Ensure we have at least minimum recommendations
+    if len(recommendations) < settings.MIN_RECOMMENDATIONS:
+        # Pad with top assessments matching the filters if needed
+        all_assessments = recommender.allowed_assessments(
+            filters, limit=settings.MIN_RECOMMENDATIONS, snapshot=snapshot)
+        existing_urls = {rec['url'] for rec in recommendations}
+        recommendations.extend([a for a in all_assessments if a['url'] not in existing_urls])
+    
+    return recommender.render_response(recommendations[:settings.MAX_RECOMMENDATIONS], snapshot)
+
+def response_cache_key(query: str, filters, snapshot) -> tuple:
+    """Response cache key: the request identity plus the catalog/index version."""
+    return (recommender.request_key(query, settings.MAX_RECOMMENDATIONS, filters),
+            recommender.index_version(snapshot))
+
+async def recommend_body(query: str, filters, trace: Optional[Dict] = None) -> Tuple[bytes, str]:
+    """
+    Serialized /recommend response and its ETag, from the response cache when
+    possible. The cache result and retrieval path are noted in `trace`, if given.
+    """
+    trace = {} if trace is None else trace
+    snapshot = recommender.snapshot
+    cache_key = response_cache_key(query, filters, snapshot)
+    cached = response_cache.get(cache_key)
+    trace["cache"] = "hit" if cached is not None else "miss"
+    if cached is not None:
+        return cached
+    return await compute_body(query, filters, snapshot, cache_key, trace)
+
+async def compute_body(query: str, filters, snapshot, cache_key: tuple,
+                       trace: Dict) -> Tuple[bytes, str]:
+    """
+    Compute, serialize and cache the /recommend response after a response
+    cache miss on `cache_key`.
+    """
+    # Get recommendations
+    recommendations = await recommender.get_recommendations_async(
+        query, 
+        top_k=settings.MAX_RECOMMENDATIONS,
+        filters=filters,
+        trace=trace,
+        snapshot=snapshot
+    )
+    
+    body = build_response(recommendations, filters, snapshot)
+    etag = make_etag(body)
+    # Transient fallbacks are not cached, so the next request retries the vector path
+    if not trace.get("degraded"):
+        response_cache.put(cache_key, (body, etag))
+    return body, etag
+
+def json_response(body: bytes, etag: str, if_none_match: Optional[str],
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve a serialized JSON body with its ETag, or 304 if the client already has it."""
+    headers = {"ETag": etag, **(headers or {})}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.post("/recommend", response_model=RecommendationResponse)
-async def recommend(request: QueryRequest):
+async def recommend(request: QueryRequest, if_none_match: Optional[str] = Header(None),
+                    x_debug_timing: Optional[str] = Header(None)):
     """
     Recommendation endpoint that accepts a job description or natural language query
     and returns recommended relevant assessments.
     
     Request:
     - query: Natural language query or job description text
+    - max_duration, required_test_types, excluded_test_types, remote_support,
+      adaptive_support: optional structured filters
     
     Response:
     - recommended_assessments: List of at least 5, at most 10 relevant assessments
+    
+    Responses carry an ETag; send it back in If-None-Match to get a 304 while
+    the catalog and index are unchanged. With an `X-Debug-Timing: 1` header,
+    per-stage timings and the retrieval path are returned in Server-Timing.
     """
     try:
         if not request.query or len(request.query.strip()) < 10:
@@ -61,30 +206,115 @@ async def recommend(request: QueryRequest):
                 detail="Query must be at least 10 characters long"
             )
         
-        # Get recommendations
-        recommendations = recommender.get_recommendations(
-            request.query, 
-            top_k=settings.MAX_RECOMMENDATIONS
-        )
+        timing = (x_debug_timing or "").lower() in ("1", "true")
+        trace = start_trace(timing or settings.SLOW_REQUEST_MS > 0)
+        start = time.perf_counter()
+        with REQUEST_SECONDS.time("recommend"):
+            body, etag = await recommend_body(request.query, request.filters(), trace)
         
-        # Ensure we have at least minimum recommendations
-        if len(recommendations) < settings.MIN_RECOMMENDATIONS:
-            # Pad with top assessments if needed
-            all_assessments = recommender.assessments[:settings.MIN_RECOMMENDATIONS]
-            recommendations.extend([a for a in all_assessments if a not in recommendations])
+        headers = {}
+        if trace is not None:
+            total = time.perf_counter() - start
+            log_if_slow(request.query, trace, total)
+            if timing:
+                headers["Server-Timing"] = server_timing(trace, total)
+        return json_response(body, etag, if_none_match, headers)
         
-        # Format response
-        formatted_recommendations = recommender.format_response(
-            recommendations[:settings.MAX_RECOMMENDATIONS]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/recommend/stream")
+async def recommend_stream(request: QueryRequest):
+    """
+    Streaming variant of /recommend for interactive clients.
+    
+    Responds with newline-delimited JSON: a "lexical" stage computed locally
+    from the keyword path, which needs no network call, followed by the
+    "final" stage with the same body /recommend would return. Each line is a
+    RecommendationResponse object with an added "stage" field. When the final
+    response is already cached, or lexical matching is the configured
+    retrieval mode, only the final stage is sent.
+    """
+    if not request.query or len(request.query.strip()) < 10:
+        raise HTTPException(
+            status_code=400, 
+            detail="Query must be at least 10 characters long"
         )
-        
-        # Convert to response models
-        assessment_responses = [
-            AssessmentResponse(**rec) for rec in formatted_recommendations
-        ]
-        
-        return RecommendationResponse(recommended_assessments=assessment_responses)
-        
+    filters = request.filters()
+    
+    def stage_line(stage: str, body: bytes) -> bytes:
+        return b'{"stage":"' + stage.encode('ascii') + b'",' + body[1:] + b'\n'
+    
+    async def stages():
+        final = None
+        try:
+            snapshot = recommender.snapshot
+            cache_key = response_cache_key(request.query, filters, snapshot)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                yield stage_line("final", cached[0])
+                return
+            # The final ranking starts right away, overlapping the lexical stage
+            final = asyncio.ensure_future(compute_body(request.query, filters, snapshot, cache_key, {}))
+            if settings.RETRIEVAL_MODE != "lexical":
+                loop = asyncio.get_running_loop()
+                recommendations = await loop.run_in_executor(
+                    recommender.cpu_pool,
+                    functools.partial(recommender.get_recommendations, request.query,
+                                      settings.MAX_RECOMMENDATIONS, filters, retrieval_mode="lexical",
+                                      snapshot=snapshot)
+                )
+                yield stage_line("lexical", build_response(recommendations, filters, snapshot))
+            body, _ = await final
+            yield stage_line("final", body)
+        except Exception as e:
+            yield json.dumps({"stage": "error", "detail": f"Internal server error: {str(e)}"}).encode('utf-8') + b'\n'
+        finally:
+            # The client went away before the final stage
+            if final is not None and not final.done():
+                final.cancel()
+    
+    # Ask reverse proxies not to buffer, so the first stage reaches the client early
+    return StreamingResponse(stages(), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
+
+@app.post("/recommend/batch", response_model=BatchRecommendationResponse)
+async def recommend_batch(request: BatchQueryRequest):
+    """
+    Batch recommendation endpoint for bulk jobs.
+    
+    Request:
+    - queries: List of queries or job descriptions
+    - the same optional structured filters as /recommend, applied to every query
+    
+    Response:
+    - results: One recommendation response per query, in request order
+    """
+    if not request.queries or len(request.queries) > settings.MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {settings.MAX_BATCH_QUERIES} queries"
+        )
+    if any(not query or len(query.strip()) < 10 for query in request.queries):
+        raise HTTPException(
+            status_code=400,
+            detail="Each query must be at least 10 characters long"
+        )
+    
+    try:
+        filters = request.filters()
+        snapshot = recommender.snapshot
+        with REQUEST_SECONDS.time("recommend_batch"):
+            batch = await recommender.get_recommendations_batch_async(
+                request.queries,
+                top_k=settings.MAX_RECOMMENDATIONS,
+                filters=filters,
+                snapshot=snapshot
+            )
+            body = b'{"results":[' + b','.join(
+                build_response(recommendations, filters, snapshot) for recommendations in batch
+            ) + b']}'
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
@@ -93,6 +323,35 @@ async def get_assessment_count():
     """Get the total number of assessments in the database."""
     return {"count": len(recommender.assessments)}
 
+@app.post("/admin/reload")
+async def reload_catalog(x_admin_token: Optional[str] = Header(None)):
+    """
+    Reload the assessments file without a restart. The new catalog and its
+    embedding index are built in the background while the current one keeps
+    serving, then swapped in atomically. Requires the X-Admin-Token header to
+    match ADMIN_TOKEN; the endpoint is disabled when ADMIN_TOKEN is unset.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    started = recommender.reload_catalog()
+    return {"started": started, **recommender.reload_status}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters for the recommendation caches."""
+    return {
+        "query_embeddings": recommender.query_cache.stats(),
+        "responses": response_cache.stats(),
+        "single_flight": recommender.single_flight.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, retrieval paths, cache and upstream counters."""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,212 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+from app.tracing import record_stage
+
+# Prometheus text exposition format, version 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Sharded:
+    """
+    Base for metrics updated on the request path. Each thread writes to its
+    own shard (a dict keyed by label values), so updates take no lock and
+    never contend; shards are only summed when the metric is scraped.
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # Once per thread
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _collect(self) -> List[Tuple[Tuple, object]]:
+        with self._lock:
+            shards = list(self._shards)
+        return [item for shard in shards for item in list(shard.items())]
+
+
+class Counter(_Sharded):
+    """Monotonic counter, optionally labelled."""
+
+    def inc(self, *label_values, amount: float = 1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        totals = {}
+        for label_values, value in self._collect():
+            totals[label_values] = totals.get(label_values, 0) + value
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(totals.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram(_Sharded):
+    """Histogram of observed values (e.g. latencies in seconds), optionally labelled."""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        shard = self._shard()
+        counts = shard.get(label_values)
+        if counts is None:
+            # One count per bucket, then +Inf, then the sum of observations
+            counts = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def time(self, *label_values) -> '_Timer':
+        """Context manager observing the duration of its block."""
+        return _Timer(self, label_values)
+
+    def timed(self, *label_values):
+        """Decorator observing the duration of every call of the function."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *label_values)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        totals = {}
+        for label_values, counts in self._collect():
+            total = totals.setdefault(label_values, [0] * len(counts))
+            for pos, count in enumerate(list(counts)):
+                total[pos] += count
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, counts in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, label_values, le)} {cumulative}")
+            labels = _label_text(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class StageHistogram(Histogram):
+    """Stage latency histogram that also adds each stage to the current request's trace."""
+
+    def observe(self, value: float, *label_values):
+        super().observe(value, *label_values)
+        record_stage(label_values[0], value)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram: Histogram, label_values: Tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+
+class Collected:
+    """
+    Metric whose values are read at scrape time from state the application
+    keeps anyway (cache counters, catalog size), so it costs nothing per request.
+    `collect` returns values by label values.
+    """
+
+    def __init__(self, name: str, documentation: str, metric_type: str,
+                 collect: Callable[[], Dict[Tuple, float]], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.collect = collect
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            print(f"Error collecting metric {metric.name}: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+# Metrics recorded on the request path
+STAGE_SECONDS = StageHistogram(
+    "shl_recommend_stage_seconds",
+    "Time spent in each recommendation pipeline stage.",
+    labels=("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "shl_request_seconds",
+    "End-to-end latency of recommendation endpoints.",
+    labels=("endpoint",),
+)
+RETRIEVAL_PATHS = Counter(
+    "shl_retrieval_path_total",
+    "Recommendation computations by retrieval path; degraded=true counts "
+    "fallbacks caused by a failed or skipped embedding call.",
+    labels=("path", "degraded"),
+)
+EMBEDDING_CALLS = Counter(
+    "shl_embedding_calls_total",
+    "Query embedding API calls by outcome (ok, error, timeout at the deadline, "
+    "rejected by the circuit breaker, skipped for the deadline, throttled by "
+    "the rate limit).",
+    labels=("outcome",),
+)
@@ -1,9 +1,23 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-class QueryRequest(BaseModel):
+class FilterFields(BaseModel):
+    max_duration: Optional[int] = None
+    required_test_types: Optional[List[str]] = None
+    excluded_test_types: Optional[List[str]] = None
+    remote_support: Optional[bool] = None
+    adaptive_support: Optional[bool] = None
+
+    def filters(self) -> dict:
+        """Structured filters set on the request, keyed by field name."""
+        return self.model_dump(include=set(FilterFields.model_fields), exclude_none=True)
+
+class QueryRequest(FilterFields):
     query: str
 
+class BatchQueryRequest(FilterFields):
+    queries: List[str]
+
 class AssessmentResponse(BaseModel):
     url: str
     name: str
@@ -16,5 +30,16 @@ class AssessmentResponse(BaseModel):
 class RecommendationResponse(BaseModel):
     recommended_assessments: List[AssessmentResponse]
 
+class BatchRecommendationResponse(BaseModel):
+    results: List[RecommendationResponse]
+
 class HealthResponse(BaseModel):
     status: str
+
+class ReadyResponse(BaseModel):
+    ready: bool
+    state: str
+    embedded: int
+    total: int
+    startup: Dict[str, float] = {}
+    upstream: Dict[str, Any] = {}
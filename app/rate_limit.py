@@ -0,0 +1,43 @@
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for outbound calls.
+
+    Tokens accrue at `rate` per second up to `burst`. A caller that finds the
+    bucket empty reserves the next token and sleeps until it is due, unless
+    that would take it past its `deadline`, in which case it is refused and
+    counted as throttled. A `rate` of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None) -> bool:
+        """Take a token, waiting if needed; False if it would not arrive by `deadline`."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                self.throttled += 1
+                return False
+            # May go negative: later callers queue behind this reservation
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def stats(self) -> Dict:
+        return {"rate_limit_per_minute": self.rate * 60, "throttled": self.throttled}
@@ -1,59 +1,509 @@
+import asyncio
+import functools
+import hashlib
 import json
 import os
-from typing import List, Dict
-import google.generativeai as genai
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, NamedTuple, Optional, Tuple
+from app.ann import IVFIndex
+from app.artifact import ArtifactError, CatalogArtifact
+from app.catalog import Catalog, TECHNICAL, BEHAVIORAL, COGNITIVE, SALES, OTHER
+from app.cache import LRUCache, normalize_query
 from app.config import settings
+from app.dispatcher import EmbeddingDispatcher
+from app.embedding_store import EmbeddingStore
+from app.embeddings import EmbeddingBackend, create_embedding_backend
+from app.keyword_index import KeywordIndex
+from app.metrics import RETRIEVAL_PATHS, STAGE_SECONDS
+from app.models import AssessmentResponse
+from app.singleflight import SingleFlight
+from app.startup import StartupTimer
+from app.tracing import collect_stages, merge_trace, run_in_context
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+
+class EmbeddingIndex(NamedTuple):
+    """
+    Immutable catalog embedding matrix, swapped in as a whole once built.
+    Rows are L2-normalized float32, so cosine similarity is a dot product.
+    Large catalogs also carry an IVF index for approximate search.
+    """
+    matrix: np.ndarray
+    missing: List[int]
+    ann: Optional[IVFIndex] = None
+
+
+class CatalogSnapshot(NamedTuple):
+    """
+    One version of the catalog with everything derived from it. Snapshots are
+    never modified: reloads and index builds publish a new one, and a request
+    uses the snapshot it started with throughout, so versions never mix.
+    """
+    assessments: List[Dict]
+    version: str
+    catalog: Catalog
+    fragments: List[Optional[bytes]]
+    keyword_index: Optional[KeywordIndex]
+    bm25_index: Optional["BM25Index"]
+    backend: EmbeddingBackend
+    embedding_store: EmbeddingStore
+    embedding_index: Optional[EmbeddingIndex] = None
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows as float32, returning `matrix` itself if already normalized."""
+    norms = np.linalg.norm(matrix, axis=1)
+    nonzero = norms > 0
+    if matrix.dtype == np.float32 and np.allclose(norms[nonzero], 1.0, atol=1e-4):
+        return matrix
+    norms[~nonzero] = 1.0
+    return (matrix / norms[:, None]).astype(np.float32)
+
+
+class BM25Index:
+    """
+    Okapi BM25 over assessment name, description and test types.
+
+    Field term counts are combined with per-field weights into one sparse
+    document-term matrix, and the BM25 term weights are precomputed into it,
+    so scoring a query is a single sparse matrix-vector product. The matrix
+    is built on first use (or by `fit`), so scikit-learn is only imported
+    when BM25 is actually used.
+    """
+
+    def __init__(self, assessments: List[Dict], k1: float = 1.5, b: float = 0.75,
+                 field_weights: Optional[Dict[str, float]] = None):
+        self.assessments = assessments
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights or {'name': 3.0, 'description': 1.0, 'test_type': 2.0}
+        self.vectorizer = None
+        self.weights = None
+        self._saved = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, assessments, arrays: Dict[str, np.ndarray], vocabulary,
+                    **params) -> 'BM25Index':
+        """
+        An index restored from the CSR arrays (data, indices, indptr) of a
+        fitted one; `vocabulary` is a callable returning its term columns.
+        """
+        index = cls(assessments, **params)
+        index._saved = (arrays, vocabulary)
+        return index
+
+    def fit(self):
+        """Build the weighted document-term matrix, once."""
+        with self._lock:
+            if self.weights is not None:
+                return
+            from sklearn.feature_extraction.text import CountVectorizer
+
+            if self._saved is not None:
+                from scipy.sparse import csr_matrix
+
+                arrays, vocabulary = self._saved
+                vocabulary = vocabulary()
+                self.vectorizer = CountVectorizer(stop_words='english', dtype=np.float32,
+                                                  vocabulary=vocabulary)
+                self.weights = csr_matrix(
+                    (arrays['data'], arrays['indices'], arrays['indptr']),
+                    shape=(len(self.assessments), len(vocabulary))
+                )
+                return
+
+            k1, b = self.k1, self.b
+            fields = {
+                'name': [a.get('name', '') for a in self.assessments],
+                'description': [a.get('description', '') for a in self.assessments],
+                'test_type': [' '.join(a.get('test_type', [])) for a in self.assessments],
+            }
+
+            vectorizer = CountVectorizer(stop_words='english', dtype=np.float32)
+            vectorizer.fit([text for texts in fields.values() for text in texts])
+
+            tf = None
+            for field, texts in fields.items():
+                counts = vectorizer.transform(texts) * self.field_weights.get(field, 1.0)
+                tf = counts if tf is None else tf + counts
+            tf = tf.tocsr()
+            tf.sum_duplicates()
+
+            n_docs = tf.shape[0]
+            doc_freq = np.bincount(tf.indices, minlength=tf.shape[1])
+            idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+            doc_len = np.asarray(tf.sum(axis=1)).ravel()
+            avg_len = doc_len.mean() if n_docs else 1.0
+            norm = k1 * (1 - b + b * doc_len / (avg_len or 1.0))
+            row_norm = np.repeat(norm, np.diff(tf.indptr)).astype(np.float32)
+
+            tf.data = idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + row_norm)
+            self.vectorizer = vectorizer
+            self.weights = tf
+
+    def score(self, query: str) -> np.ndarray:
+        """BM25 score of every assessment for the query."""
+        if self.weights is None:
+            self.fit()
+        query_vec = self.vectorizer.transform([query])
+        return np.asarray((self.weights @ query_vec.T).todense()).ravel()
+
 
 class AssessmentRecommender:
-    def __init__(self):
-        self.assessments = []
-        self.embeddings = []
-        self.api_enabled = False
-        self.load_assessments()
-        
-        # Configure Gemini API
-        if settings.GOOGLE_API_KEY and settings.GOOGLE_API_KEY.strip():
-            try:
-                genai.configure(api_key=settings.GOOGLE_API_KEY)
-                self.api_enabled = True
-                print("Gemini API configured successfully")
-            except Exception as e:
-                print(f"Warning: Could not configure Gemini API: {e}")
-                print("Falling back to keyword-based recommendations")
-        else:
-            print("Warning: GOOGLE_API_KEY not set. Using keyword-based recommendations.")
+    def __init__(self, load: bool = True):
+        """
+        With `load=False` the catalog is not read until load_assessments() is
+        called, so an importing process (the API) can defer it to startup.
+        """
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self.startup = StartupTimer()
+        self.index_status = {"state": "idle", "embedded": 0, "total": 0}
+        self.reload_status = {"state": "idle", "version": ""}
+        self._index_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.query_cache = LRUCache(settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TTL)
+        self.single_flight = SingleFlight()
+        self.dispatcher = EmbeddingDispatcher(settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+                                              settings.EMBEDDING_MAX_BATCH,
+                                              settings.EMBEDDING_CONCURRENCY)
+        self.io_pool = ThreadPoolExecutor(max_workers=max(1, settings.IO_POOL_SIZE),
+                                          thread_name_prefix="recommender-io")
+        self.cpu_pool = ThreadPoolExecutor(max_workers=max(1, settings.CPU_POOL_SIZE),
+                                           thread_name_prefix="recommender-cpu")
+        if load:
+            self.load_assessments()
+
+    @property
+    def assessments(self) -> List[Dict]:
+        return self.snapshot.assessments
+
+    @property
+    def backend(self) -> EmbeddingBackend:
+        return self.snapshot.backend
         
-    def load_assessments(self):
-        """Load assessments from JSON file."""
-        if os.path.exists(settings.ASSESSMENTS_FILE):
-            with open(settings.ASSESSMENTS_FILE, 'r', encoding='utf-8') as f:
-                self.assessments = json.load(f)
-            print(f"Loaded {len(self.assessments)} assessments")
-        else:
-            print("No assessments file found. Please run scraper first.")
-            
-    def get_embedding(self, text: str) -> List[float]:
+    def load_assessments(self, use_artifact: bool = True):
+        """
+        Load assessments from the prebuilt artifact when it matches the catalog
+        file (see load_artifact), otherwise from the JSON file.
         """
-        Get embedding for text using Gemini API.
+        with self.startup.phase("catalog_load"):
+            snapshot = self.load_artifact() if use_artifact else None
+            if snapshot is None:
+                assessments, version = self.read_catalog()
+                if assessments is None:
+                    print("No assessments file found. Please run scraper first.")
+                    assessments = []
+                snapshot = self.build_snapshot(
+                    assessments, version, create_embedding_backend(settings.EMBEDDING_BACKEND))
+            elif snapshot.embedding_index is not None:
+                total = len(snapshot.assessments)
+                embedded = total - len(snapshot.embedding_index.missing)
+                self.index_status.update(state="ready", embedded=embedded, total=total)
+            self.snapshot = snapshot
+        if snapshot.embedding_index is not None and snapshot.embedding_index.missing:
+            self.start_backfill(snapshot)
+        self.reload_status["version"] = snapshot.version
+        print(f"Loaded {len(snapshot.assessments)} assessments")
+
+    def artifact_options(self) -> Dict:
+        """Settings baked into an artifact; one built with other values is not used."""
+        return {
+            "bm25": [settings.BM25_K1, settings.BM25_B, settings.BM25_NAME_WEIGHT,
+                     settings.BM25_DESCRIPTION_WEIGHT, settings.BM25_TEST_TYPE_WEIGHT],
+            "ann_min_size": settings.ANN_MIN_SIZE,
+        }
+
+    def catalog_version(self) -> str:
+        """Hash of the catalog file, as in read_catalog, without parsing it."""
+        if not os.path.exists(settings.ASSESSMENTS_FILE):
+            return ""
+        with open(settings.ASSESSMENTS_FILE, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+
+    def load_artifact(self) -> Optional[CatalogSnapshot]:
         """
-        if not self.api_enabled:
+        Snapshot backed by the catalog artifact at settings.CATALOG_ARTIFACT, or
+        None if there is none or it cannot be used: corrupt, built from another
+        catalog file (stale), or for another embedding model or settings.
+
+        Arrays, response fragments and assessments are read from the memory-mapped
+        file as they are used, so nothing is parsed or rebuilt here apart from
+        the keyword index. The catalog file is only hashed when its size or
+        mtime differ from those recorded at build time.
+        """
+        path = settings.CATALOG_ARTIFACT
+        if not os.path.exists(path):
             return None
-            
         try:
-            result = genai.embed_content(
-                model=settings.EMBEDDING_MODEL,
-                content=text,
-                task_type="retrieval_document"
+            artifact = CatalogArtifact(path, verify=settings.ARTIFACT_VERIFY)
+        except ArtifactError as e:
+            print(f"Warning: Ignoring catalog artifact: {e}")
+            return None
+
+        version = artifact.catalog_version
+        if artifact.catalog_stat is None or artifact.catalog_stat != self.catalog_stat():
+            version = self.catalog_version()
+        if version and artifact.catalog_version != version:
+            print(f"Warning: Ignoring stale catalog artifact {path} (built from catalog "
+                  f"version {artifact.catalog_version}, file is {version}); rebuild it "
+                  f"with python -m app.artifact")
+            return None
+        if artifact.header['options'] != self.artifact_options():
+            print(f"Warning: Ignoring catalog artifact {path}: built with other settings")
+            return None
+
+        backend = create_embedding_backend(settings.EMBEDDING_BACKEND)
+        has_embeddings = artifact.has('embeddings')
+        if has_embeddings and not backend.restore(artifact.model_id):
+            print(f"Warning: Ignoring catalog artifact {path}: built for embedding model "
+                  f"{artifact.model_id}, which the {settings.EMBEDDING_BACKEND} backend does not provide")
+            return None
+
+        assessments = artifact.table('assessments', decode=json.loads)
+        # Without stored vectors, backends fitted on the catalog are fitted (or
+        # their saved model loaded) as on the JSON path, so the index can be built
+        if not has_embeddings and backend.catalog_dependent:
+            backend.prepare([self.create_assessment_text(a) for a in assessments])
+        catalog = Catalog.from_columns(
+            assessments,
+            {name: artifact.array('catalog_' + name) for name in Catalog.COLUMNS},
+            artifact.header['test_type_bits'],
+        )
+        fragments = artifact.table('fragments', decode=lambda record: record or None)
+
+        bm25_index = None
+        if artifact.has('bm25_data'):
+            bm25_index = BM25Index.from_arrays(
+                assessments,
+                {name: artifact.array('bm25_' + name) for name in ('data', 'indices', 'indptr')},
+                lambda: json.loads(artifact.blob('bm25_vocabulary')),
+                k1=settings.BM25_K1,
+                b=settings.BM25_B,
+                field_weights={
+                    'name': settings.BM25_NAME_WEIGHT,
+                    'description': settings.BM25_DESCRIPTION_WEIGHT,
+                    'test_type': settings.BM25_TEST_TYPE_WEIGHT,
+                }
             )
-            return result['embedding']
+
+        embedding_index = None
+        if has_embeddings:
+            ann = None
+            if artifact.has('ann_centroids'):
+                ann = IVFIndex(artifact.array('ann_centroids'), artifact.array('ann_offsets'),
+                               artifact.array('ann_ids'))
+            embedding_index = EmbeddingIndex(artifact.array('embeddings'),
+                                             artifact.array('embedding_missing').tolist(), ann)
+            # Too sparse to rank by: build (and backfill) the index at startup instead
+            if not self.index_ready(embedding_index):
+                embedding_index = None
+
+        print(f"Mapped catalog artifact {path} (version {artifact.catalog_version})")
+        return CatalogSnapshot(
+            assessments=assessments,
+            version=artifact.catalog_version,
+            catalog=catalog,
+            fragments=fragments,
+            keyword_index=pickle.loads(artifact.blob('keyword_index')),
+            bm25_index=bm25_index,
+            backend=backend,
+            embedding_store=EmbeddingStore(settings.EMBEDDINGS_DIR, backend.model_id),
+            embedding_index=embedding_index,
+        )
+
+    def read_catalog(self) -> Tuple[Optional[List[Dict]], str]:
+        """Assessments in the catalog file and a hash of its contents, or (None, "") if absent."""
+        if not os.path.exists(settings.ASSESSMENTS_FILE):
+            return None, ""
+        with open(settings.ASSESSMENTS_FILE, 'rb') as f:
+            raw = f.read()
+        return json.loads(raw.decode('utf-8')), hashlib.sha256(raw).hexdigest()[:16]
+
+    def build_snapshot(self, assessments: List[Dict], version: str,
+                       backend: EmbeddingBackend) -> CatalogSnapshot:
+        """
+        Derive the catalog arrays, response fragments and lexical indexes for
+        `assessments`. The embedding index is built separately (build_embeddings).
+        """
+        texts = [self.create_assessment_text(a) for a in assessments]
+        backend.prepare(texts)
+        bm25_index = None
+        if assessments:
+            bm25_index = BM25Index(
+                assessments,
+                k1=settings.BM25_K1,
+                b=settings.BM25_B,
+                field_weights={
+                    'name': settings.BM25_NAME_WEIGHT,
+                    'description': settings.BM25_DESCRIPTION_WEIGHT,
+                    'test_type': settings.BM25_TEST_TYPE_WEIGHT,
+                }
+            )
+            # Fit now when BM25 serves requests; otherwise only on first use
+            if settings.LEXICAL_ENGINE == "bm25":
+                bm25_index.fit()
+        return CatalogSnapshot(
+            assessments=assessments,
+            version=version,
+            catalog=Catalog(assessments),
+            fragments=self.render_fragments(assessments),
+            keyword_index=KeywordIndex(assessments, texts),
+            bm25_index=bm25_index,
+            backend=backend,
+            embedding_store=EmbeddingStore(settings.EMBEDDINGS_DIR, backend.model_id),
+        )
+
+    def reload_catalog(self, background: bool = True) -> bool:
+        """
+        Pick up a changed catalog file without a restart.
+
+        A new snapshot, including its embedding index, is built off the request
+        path while the current one keeps serving; unchanged assessments reuse
+        their stored vectors. It is then published with a single assignment,
+        so requests in flight finish on the snapshot they started with.
+        Returns False if a reload is already running.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        self.reload_status["state"] = "reloading"
+        if background:
+            threading.Thread(target=self._run_reload, name="catalog-reload", daemon=True).start()
+        else:
+            self._run_reload()
+        return True
+
+    def _run_reload(self):
+        try:
+            assessments, version = self.read_catalog()
+            current = self.snapshot
+            if assessments is None or version == current.version:
+                self.reload_status["state"] = "idle"
+                return
+
+            # Backends fitted on the catalog (local) get a fresh instance
+            backend = current.backend
+            if backend.catalog_dependent:
+                backend = create_embedding_backend(settings.EMBEDDING_BACKEND)
+            snapshot = self.build_snapshot(assessments, version, backend)
+
+            status = {"embedded": 0, "total": 0}
+            index = None
+            index_state = self.index_status["state"]
+            if index_state != "idle":
+                index_state = "disabled"
+                if backend.enabled and assessments:
+                    index = self.build_embeddings(snapshot, status)
+                    index_state = "partial"
+                    if self.index_ready(index):
+                        snapshot = snapshot._replace(embedding_index=index)
+                        index_state = "ready"
+
+            with self._index_lock:
+                self.snapshot = snapshot
+                self.index_status.update(status, state=index_state)
+            self.reload_status.update(state="idle", version=version)
+            print(f"Reloaded catalog: {len(assessments)} assessments (version {version})")
+            if index is not None and index.missing:
+                self.start_backfill(snapshot)
         except Exception as e:
-            if self.api_enabled:
-                print(f"Error getting embedding: {e}")
-            # Fallback to simple word-based similarity if API fails
+            print(f"Error reloading catalog: {e}")
+            self.reload_status["state"] = "failed"
+        finally:
+            self._reload_lock.release()
+
+    def catalog_stat(self) -> Optional[List[int]]:
+        """Size and mtime (ns) of the catalog file, or None if it is absent."""
+        try:
+            stat = os.stat(settings.ASSESSMENTS_FILE)
+        except OSError:
             return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def catalog_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(settings.ASSESSMENTS_FILE).st_mtime_ns
+        except OSError:
+            return None
+
+    def watch_catalog(self, interval: float):
+        """Poll the catalog file every `interval` seconds and reload it when it changes."""
+        def watch():
+            last = self.catalog_mtime()
+            while True:
+                time.sleep(interval)
+                mtime = self.catalog_mtime()
+                # A change seen while a reload is running is retried on the next poll
+                if mtime is not None and mtime != last and self.reload_catalog(background=False):
+                    last = mtime
+
+        threading.Thread(target=watch, name="catalog-watch", daemon=True).start()
+            
+    def get_embedding(self, text: str, backend: Optional[EmbeddingBackend] = None,
+                      deadline: Optional[float] = None) -> List[float]:
+        """
+        Get embedding for text from the configured embedding backend. For
+        remote backends, concurrent calls are batched by the dispatcher.
+        """
+        backend = backend or self.backend
+        if backend.remote and backend.enabled and settings.EMBEDDING_BATCH_WINDOW_MS > 0:
+            return self.dispatcher.embed(backend, text, deadline)
+        return backend.embed_query(text, deadline)
     
+    def get_query_embedding(self, query: str, backend: Optional[EmbeddingBackend] = None,
+                            deadline: Optional[float] = None) -> List[float]:
+        """
+        Get embedding for a user query, served from the LRU cache when the
+        same normalized query was embedded recently. The backend is not called
+        past `deadline` (time.monotonic(), see request_deadline).
+        """
+        backend = backend or self.backend
+        key = (backend.model_id, normalize_query(query))
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            with STAGE_SECONDS.time("embed"):
+                embedding = self.get_embedding(query, backend, deadline)
+            if embedding is not None:
+                self.query_cache.put(key, embedding)
+        return embedding
+
+    def get_query_embeddings(self, queries: List[str],
+                             backend: Optional[EmbeddingBackend] = None,
+                             deadline: Optional[float] = None) -> List[Optional[List[float]]]:
+        """
+        Embeddings for many queries, using the query cache and embedding the
+        remaining distinct queries in as few backend batch calls as possible.
+        Queries that could not be embedded get None.
+        """
+        backend = backend or self.backend
+        keys = [(backend.model_id, normalize_query(q)) for q in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        pending = {}
+        for pos, key in enumerate(keys):
+            if embeddings[pos] is None and key not in pending:
+                pending[key] = queries[pos]
+
+        if pending and backend.enabled:
+            pending_keys = list(pending)
+            with STAGE_SECONDS.time("embed"):
+                fresh = backend.embed_queries([pending[key] for key in pending_keys], deadline)
+            fresh = {pending_keys[i]: emb for i, emb in fresh.items()}
+            for key, emb in fresh.items():
+                self.query_cache.put(key, emb)
+            embeddings = [emb if emb is not None else fresh.get(key)
+                          for emb, key in zip(embeddings, keys)]
+        return embeddings
+
+    @staticmethod
+    def request_deadline() -> Optional[float]:
+        """Deadline for the embedding call of a request starting now, per settings.REQUEST_DEADLINE_MS."""
+        if settings.REQUEST_DEADLINE_MS <= 0:
+            return None
+        return time.monotonic() + settings.REQUEST_DEADLINE_MS / 1000
+
     def create_assessment_text(self, assessment: Dict) -> str:
         """
         Create searchable text from assessment data.
@@ -65,49 +515,588 @@ class AssessmentRecommender:
         ]
         return ' '.join(text_parts)
     
-    def get_recommendations(self, query: str, top_k: int = 10) -> List[Dict]:
+    def build_embeddings(self, snapshot: CatalogSnapshot, status: Dict) -> EmbeddingIndex:
+        """
+        Build the embedding index of `snapshot`, reusing stored vectors.
+
+        Only assessments whose text changed since the last build (or that were
+        never embedded) are sent to the API; the result is written back to the
+        embedding store for the next start. Items that could not be embedded
+        are recorded in `missing` and excluded from vector ranking. Progress
+        is reported in the `embedded` and `total` counts of `status`.
+        """
+        store = snapshot.embedding_store
+        texts = [self.create_assessment_text(a) for a in snapshot.assessments]
+        keys = [store.content_key(text) for text in texts]
+        matrix, missing = store.lookup(keys)
+        status.update(embedded=len(texts) - len(missing), total=len(texts))
+
+        if not missing:
+            matrix = normalize_rows(matrix)
+            return EmbeddingIndex(matrix, [], self.build_ann_index(store, keys, matrix, []))
+
+        def on_progress(count):
+            status["embedded"] += count
+
+        print(f"Generating embeddings for {len(missing)} of {len(texts)} assessments...")
+        fresh = snapshot.backend.embed_documents([texts[pos] for pos in missing], on_progress)
+        fresh = {missing[i]: emb for i, emb in fresh.items()}
+
+        if matrix is None:
+            dim = len(next(iter(fresh.values()), [0] * 768))
+            matrix = np.zeros((len(texts), dim), dtype=np.float32)
+        for pos, emb in fresh.items():
+            matrix[pos] = emb
+        matrix = normalize_rows(matrix)
+
+        # Failed items are not persisted, so they are retried by the backfill
+        # (see _run_backfill) or the next build
+        failed = set(missing) - set(fresh)
+        stored = [pos for pos in range(len(texts)) if pos not in failed]
+        if fresh:
+            try:
+                store.save([keys[pos] for pos in stored], matrix[stored])
+            except OSError as e:
+                print(f"Warning: Could not save embedding store: {e}")
+
+        missing = sorted(failed)
+        return EmbeddingIndex(matrix, missing, self.build_ann_index(store, keys, matrix, missing))
+
+    def build_ann_index(self, store: EmbeddingStore, keys: List[str],
+                        matrix: np.ndarray, missing: List[int]) -> Optional[IVFIndex]:
+        """
+        Load or build the IVF index for catalogs of at least settings.ANN_MIN_SIZE
+        items. It is saved next to the embedding store and reused while the
+        catalog vectors, including which of them are `missing`, are unchanged.
+        """
+        if len(matrix) < settings.ANN_MIN_SIZE:
+            return None
+
+        digest = hashlib.sha256()
+        digest.update(f"{settings.ANN_NLIST}\n".encode('utf-8'))
+        for key in keys:
+            digest.update(key.encode('utf-8'))
+        digest.update(json.dumps(missing).encode('utf-8'))
+        fingerprint = digest.hexdigest()
+        path = os.path.splitext(store.matrix_path)[0] + '.ivf.npz'
+
+        ann = IVFIndex.load(path, fingerprint)
+        if ann is None:
+            print(f"Building ANN index for {len(matrix)} assessments...")
+            ann = IVFIndex.build(matrix, nlist=settings.ANN_NLIST or None)
+            try:
+                ann.save(path, fingerprint)
+            except OSError as e:
+                print(f"Warning: Could not save ANN index: {e}")
+        return ann
+
+    def index_ready(self, index: EmbeddingIndex) -> bool:
+        """Whether enough of the catalog is embedded (settings.EMBEDDING_MIN_COVERAGE) to rank by vectors."""
+        total = len(index.matrix)
+        return total > 0 and (total - len(index.missing)) / total >= settings.EMBEDDING_MIN_COVERAGE
+
+    def _run_index_build(self, snapshot: CatalogSnapshot):
+        """
+        Build the embedding index and publish it with a new snapshot, unless
+        too few assessments could be embedded (state "partial"); missing
+        embeddings are then retried in the background.
+        """
+        start = time.perf_counter()
+        try:
+            index = self.build_embeddings(snapshot, self.index_status)
+        except Exception as e:
+            print(f"Error building embedding index: {e}")
+            with self._index_lock:
+                if self.snapshot is snapshot:
+                    self.index_status["state"] = "failed"
+            return
+        ready = self.index_ready(index)
+        with self._index_lock:
+            # A reload published a newer catalog meanwhile, with its own index
+            if self.snapshot is not snapshot:
+                return
+            if ready:
+                self.snapshot = snapshot._replace(embedding_index=index)
+            self.index_status["state"] = "ready" if ready else "partial"
+        if index.missing:
+            self.start_backfill(snapshot)
+        if not ready:
+            print(f"Embedding index not published: {len(index.missing)} of "
+                  f"{len(index.matrix)} assessments could not be embedded")
+            return
+        elapsed = time.perf_counter() - start
+        self.startup.record("index_load", elapsed)
+        print(f"Embedding index ready in {elapsed:.2f}s")
+
+    def start_backfill(self, snapshot: CatalogSnapshot):
+        """Retry the missing embeddings of `snapshot`'s catalog in the background."""
+        threading.Thread(target=self._run_backfill, args=(snapshot,),
+                         name="index-backfill", daemon=True).start()
+
+    def _run_backfill(self, snapshot: CatalogSnapshot):
+        """
+        Rebuild the embedding index of `snapshot`'s catalog, which only embeds
+        the assessments still missing, with pauses doubling from
+        settings.EMBEDDING_BACKFILL_SECONDS up to EMBEDDING_BACKFILL_MAX_SECONDS.
+        A new snapshot is published whenever embeddings come back. Stops once
+        nothing is missing or a reload replaced the catalog.
+        """
+        delay = settings.EMBEDDING_BACKFILL_SECONDS
+        while True:
+            time.sleep(delay)
+            delay = min(delay * 2, settings.EMBEDDING_BACKFILL_MAX_SECONDS)
+            if self.snapshot.catalog is not snapshot.catalog:
+                return
+            status = {"embedded": 0, "total": 0}
+            try:
+                index = self.build_embeddings(snapshot, status)
+            except Exception as e:
+                print(f"Error backfilling embeddings: {e}")
+                continue
+            with self._index_lock:
+                current = self.snapshot
+                if current.catalog is not snapshot.catalog:
+                    return
+                published = current.embedding_index
+                if self.index_ready(index) and (published is None or
+                                                len(index.missing) < len(published.missing)):
+                    self.snapshot = current._replace(embedding_index=index)
+                    self.index_status.update(status, state="ready")
+                    print(f"Embedding index updated: {len(index.missing)} assessments still missing")
+                elif published is None:
+                    self.index_status.update(status)
+            if not index.missing:
+                return
+
+    def start_index_build(self, background: bool = True):
+        """
+        Start building the embedding index unless a build already ran.
+        Until it finishes, requests are served by the keyword path.
+        """
+        with self._index_lock:
+            if self.index_status["state"] != "idle":
+                return
+            snapshot = self.snapshot
+            if not snapshot.backend.enabled or not snapshot.assessments:
+                self.index_status["state"] = "disabled"
+                return
+            self.index_status["state"] = "building"
+
+        if background:
+            threading.Thread(target=self._run_index_build, args=(snapshot,),
+                             name="index-build", daemon=True).start()
+        else:
+            self._run_index_build(snapshot)
+
+    def embedding_index(self, snapshot: CatalogSnapshot) -> Optional[EmbeddingIndex]:
+        """
+        Embedding index for `snapshot`, or None while it is being built.
+        The index is built inline when nothing started it (e.g. offline scripts),
+        and one published for the same catalog after `snapshot` was taken is used.
+        """
+        if snapshot.embedding_index is None:
+            self.start_index_build(background=False)
+            latest = self.snapshot
+            if latest.catalog is snapshot.catalog:
+                return latest.embedding_index
+        return snapshot.embedding_index
+
+    def vector_unavailable(self, snapshot: CatalogSnapshot) -> bool:
+        """
+        Whether `snapshot` has no embedding index to rank by yet (it is being
+        built or backfilled, or could not be built), so embedding a query would
+        be wasted. An index nobody started (state "idle") is built on first use.
+        """
+        if snapshot.embedding_index is not None:
+            return False
+        latest = self.snapshot
+        if latest.catalog is snapshot.catalog and latest.embedding_index is not None:
+            return False
+        return self.index_status["state"] != "idle"
+
+    def vector_similarities(self, query: str, mask: Optional[np.ndarray] = None,
+                            query_embedding: Optional[List[float]] = None,
+                            snapshot: Optional[CatalogSnapshot] = None,
+                            deadline: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Cosine similarity of the query to every assessment, or None when the
+        vector path is unavailable (no embedding, or the index is still building).
+        Assessments outside `mask` are not scored and get -inf.
+        """
+        snapshot = snapshot or self.snapshot
+        # While a background build is running, serve the keyword path instead,
+        # without spending an embedding call
+        index = self.embedding_index(snapshot)
+        if index is None:
+            return None
+        
+        # Get query embedding, unless the caller already fetched it
+        if query_embedding is None:
+            query_embedding = self.get_query_embedding(query, snapshot.backend, deadline)
+        if query_embedding is None:
+            return None
+        
+        return self.score_query(index, query_embedding, mask)
+
+    def get_recommendations(self, query: str, top_k: int = 10, filters: Optional[Dict] = None,
+                            query_embedding: Optional[List[float]] = None,
+                            retrieval_mode: Optional[str] = None,
+                            trace: Optional[Dict] = None,
+                            snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
         """
         Get top K recommendations for a query.
         Implements balanced recommendations across test types.
+        Structured `filters` (see Catalog.filter_mask) are applied before scoring.
+        `query_embedding` skips the embedding call when already known, and
+        `retrieval_mode` overrides settings.RETRIEVAL_MODE for this call.
+        If a `trace` dict is given, the retrieval path taken is recorded in it
+        (see record_path). Everything is read from `snapshot`, by default the
+        current one.
         """
-        if not self.assessments:
+        snapshot = snapshot or self.snapshot
+        if not snapshot.assessments:
             return []
         
+        mask = snapshot.catalog.filter_mask(filters)
+        if mask is not None and not mask.any():
+            return []
+        
+        retrieval_mode = retrieval_mode or settings.RETRIEVAL_MODE
+        if retrieval_mode == "lexical":
+            self.record_path(trace, "lexical")
+            return self.lexical_recommendations(query, top_k, mask=mask, snapshot=snapshot)
+        if retrieval_mode == "hybrid":
+            return self.hybrid_recommendations(query, top_k, mask, trace, snapshot, query_embedding)
+        
         try:
-            # Get query embedding
-            query_embedding = self.get_embedding(query)
-            
-            if query_embedding is None:
-                # Fallback to keyword-based matching
-                return self.keyword_based_recommendations(query, top_k)
-            
-            # Get embeddings for all assessments if not cached
-            if not self.embeddings:
-                print("Generating embeddings for assessments...")
-                for assessment in self.assessments:
-                    text = self.create_assessment_text(assessment)
-                    emb = self.get_embedding(text)
-                    self.embeddings.append(emb if emb else [0] * 768)
-            
             # Calculate similarity scores
-            query_emb = np.array(query_embedding).reshape(1, -1)
-            assessment_embs = np.array(self.embeddings)
-            similarities = cosine_similarity(query_emb, assessment_embs)[0]
+            similarities = self.vector_similarities(query, mask, query_embedding, snapshot)
             
-            # Get top candidates
-            top_indices = np.argsort(similarities)[::-1][:top_k * 2]
-            
-            # Balance recommendations across test types
-            recommendations = self.balance_recommendations(top_indices, similarities, query, top_k)
+            if similarities is None:
+                # Fallback to keyword-based matching
+                self.record_path(trace, "lexical", degraded=self.vector_failed(snapshot))
+                return self.lexical_recommendations(query, top_k, mask=mask, snapshot=snapshot)
             
-            return recommendations[:top_k]
+            self.record_path(trace, "vector")
+            return self.rank_similarities(query, similarities, top_k, snapshot)
             
         except Exception as e:
             print(f"Error in get_recommendations: {e}")
-            return self.keyword_based_recommendations(query, top_k)
+            self.record_path(trace, "lexical", degraded=True)
+            return self.lexical_recommendations(query, top_k, mask=mask, snapshot=snapshot)
+
+    @staticmethod
+    def record_path(trace: Optional[Dict], path: str, degraded: bool = False):
+        """
+        Note in `trace` which retrieval path served a request. `degraded` marks
+        a transient fallback (an embedding call failed or missed its budget),
+        as opposed to the steady state of the current index and backend.
+        """
+        if trace is not None:
+            trace["path"] = path
+            trace["degraded"] = degraded
+
+    def vector_failed(self, snapshot: CatalogSnapshot) -> bool:
+        """
+        Whether the vector path was expected to work, so falling back is transient.
+        Only remote backends fail transiently; a local one returns no vector for
+        queries without catalog vocabulary every time.
+        """
+        backend = snapshot.backend
+        return backend.enabled and backend.remote and snapshot.embedding_index is not None
+
+    def rank_similarities(self, query: str, similarities: np.ndarray, top_k: int,
+                          snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
+        """Top candidates by similarity, balanced across test types."""
+        # Get top candidates
+        top_indices = self.top_candidates(similarities, top_k * 2)
+        
+        # Balance recommendations across test types
+        recommendations = self.balance_recommendations(top_indices, similarities, query, top_k, snapshot)
+        
+        return recommendations[:top_k]
+
+    def get_recommendations_batch(self, queries: List[str], top_k: int = 10,
+                                  filters: Optional[Dict] = None,
+                                  query_embeddings: Optional[List[Optional[List[float]]]] = None,
+                                  snapshot: Optional[CatalogSnapshot] = None) -> List[List[Dict]]:
+        """
+        Recommendations for many queries at once.
+
+        In vector mode all queries are embedded together and scored with one
+        matrix-matrix product against the catalog (in row blocks to bound
+        memory); balancing is then applied per query. Other modes, and queries
+        that could not be embedded, go through get_recommendations one by one.
+        """
+        snapshot = snapshot or self.snapshot
+        if not snapshot.assessments:
+            return [[] for _ in queries]
+        if settings.RETRIEVAL_MODE != "vector" or not snapshot.backend.enabled:
+            return [self.get_recommendations(q, top_k, filters, snapshot=snapshot) for q in queries]
+
+        mask = snapshot.catalog.filter_mask(filters)
+        if mask is not None and not mask.any():
+            return [[] for _ in queries]
+
+        index = self.embedding_index(snapshot)
+        if query_embeddings is None and index is not None:
+            query_embeddings = self.get_query_embeddings(queries, snapshot.backend)
+
+        results = [None] * len(queries)
+        embedded = [pos for pos, emb in enumerate(query_embeddings or []) if emb is not None]
+        if index is not None and embedded:
+            if index.ann is not None:
+                for pos in embedded:
+                    similarities = self.score_query(index, query_embeddings[pos], mask)
+                    results[pos] = self.rank_similarities(queries[pos], similarities, top_k, snapshot)
+            else:
+                query_matrix = normalize_rows(
+                    np.asarray([query_embeddings[pos] for pos in embedded], dtype=np.float32))
+                columns = np.flatnonzero(mask) if mask is not None else None
+                catalog_matrix = index.matrix if columns is None else index.matrix[columns]
+                block = max(1, (1 << 24) // max(1, len(catalog_matrix)))
+                for start in range(0, len(embedded), block):
+                    scores = query_matrix[start:start + block] @ catalog_matrix.T
+                    for row, pos in enumerate(embedded[start:start + block]):
+                        if columns is None:
+                            similarities = scores[row]
+                        else:
+                            similarities = np.full(len(index.matrix), -np.inf, dtype=np.float32)
+                            similarities[columns] = scores[row]
+                        if index.missing:
+                            similarities[index.missing] = -np.inf
+                        results[pos] = self.rank_similarities(queries[pos], similarities, top_k, snapshot)
+
+        for pos, result in enumerate(results):
+            if result is None:
+                results[pos] = self.lexical_recommendations(queries[pos], top_k, mask=mask, snapshot=snapshot)
+        return results
+
+    async def get_recommendations_batch_async(self, queries: List[str], top_k: int = 10,
+                                              filters: Optional[Dict] = None,
+                                              snapshot: Optional[CatalogSnapshot] = None) -> List[List[Dict]]:
+        """
+        Non-blocking variant of get_recommendations_batch: embeddings are
+        fetched on the I/O pool and scoring runs on the CPU pool.
+        """
+        snapshot = snapshot or self.snapshot
+        loop = asyncio.get_running_loop()
+        query_embeddings = None
+        if (settings.RETRIEVAL_MODE == "vector" and snapshot.backend.enabled
+                and not self.vector_unavailable(snapshot)):
+            query_embeddings = await loop.run_in_executor(
+                self.io_pool, self.get_query_embeddings, queries, snapshot.backend,
+                self.request_deadline())
+        return await loop.run_in_executor(
+            self.cpu_pool, self.get_recommendations_batch, queries, top_k, filters,
+            query_embeddings, snapshot)
+
+    def request_key(self, query: str, top_k: int, filters: Optional[Dict] = None) -> tuple:
+        """Hashable identity of a recommendation request: normalized query and parameters."""
+        filter_items = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in (filters or {}).items()
+        ))
+        return (normalize_query(query), top_k, filter_items, settings.RETRIEVAL_MODE)
+
+    def index_version(self, snapshot: Optional[CatalogSnapshot] = None) -> str:
+        """
+        Version of everything a response depends on besides the request: the
+        catalog contents, the embedding model and whether vectors are in use.
+        It changes when the catalog is reloaded, the index becomes ready or
+        missing embeddings are backfilled.
+        """
+        snapshot = snapshot or self.snapshot
+        index = snapshot.embedding_index
+        vectors = f"vector-{len(index.missing)}" if index is not None else "lexical"
+        return f"{snapshot.version}:{snapshot.backend.model_id}:{vectors}"
+
+    async def get_recommendations_async(self, query: str, top_k: int = 10,
+                                        filters: Optional[Dict] = None,
+                                        trace: Optional[Dict] = None,
+                                        snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
+        """
+        Non-blocking variant of get_recommendations for the API.
+
+        In vector and hybrid mode the query embedding (a network call for
+        remote backends) runs on the I/O pool and scoring (and fusion) on the
+        CPU pool, so the event loop is never blocked and concurrent requests
+        overlap their upstream calls. The embedding call gets at most
+        settings.REQUEST_DEADLINE_MS (HYBRID_BUDGET_MS in hybrid mode); when it
+        is skipped, fails or the circuit breaker is open, the request is served
+        by the lexical path. Concurrent identical requests on the same snapshot
+        share one computation (single flight).
+        """
+        snapshot = snapshot or self.snapshot
+        if not settings.SINGLE_FLIGHT:
+            recommendations, path = await self._compute_recommendations_async(
+                query, top_k, filters, snapshot)
+        else:
+            key = (self.request_key(query, top_k, filters), self.index_version(snapshot))
+            recommendations, path = await self.single_flight.do(
+                key, lambda: self._compute_recommendations_async(query, top_k, filters, snapshot))
+        RETRIEVAL_PATHS.inc(path.get("path", "none"), "true" if path.get("degraded") else "false")
+        if trace is not None:
+            merge_trace(trace, path)
+        # Each waiter gets its own list, so callers can extend it safely
+        return list(recommendations)
+
+    async def _compute_recommendations_async(self, query: str, top_k: int, filters: Optional[Dict],
+                                             snapshot: CatalogSnapshot) -> Tuple[List[Dict], Dict]:
+        """
+        Recommendations and the trace of their computation: the retrieval path
+        and stage timings, which every request sharing it merges into its own.
+        """
+        with collect_stages({"stages": {}}) as trace:
+            recommendations = await self._recommendations_with_trace(query, top_k, filters, snapshot, trace)
+        return recommendations, trace
+
+    async def _recommendations_with_trace(self, query: str, top_k: int, filters: Optional[Dict],
+                                          snapshot: CatalogSnapshot, trace: Dict) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        get_recommendations = functools.partial(
+            self.get_recommendations, query, top_k, filters, trace=trace, snapshot=snapshot)
+        if settings.RETRIEVAL_MODE == "lexical" or not snapshot.backend.enabled:
+            recommendations = await loop.run_in_executor(self.cpu_pool, run_in_context(get_recommendations))
+            return recommendations
+        if self.vector_unavailable(snapshot):
+            recommendations = await loop.run_in_executor(self.cpu_pool, run_in_context(
+                get_recommendations, retrieval_mode="lexical"))
+            return recommendations
+
+        # Pool work runs in this context, so its stages land in the computation's trace
+        if settings.RETRIEVAL_MODE == "hybrid":
+            budget = settings.HYBRID_BUDGET_MS / 1000
+            embedding = loop.run_in_executor(self.io_pool, run_in_context(
+                self.get_query_embedding, query, snapshot.backend, time.monotonic() + budget))
+            try:
+                query_embedding = await asyncio.wait_for(embedding, budget)
+            except asyncio.TimeoutError:
+                print("Vector leg missed the latency budget, serving lexical ranking")
+                query_embedding = None
+        else:
+            query_embedding = await loop.run_in_executor(self.io_pool, run_in_context(
+                self.get_query_embedding, query, snapshot.backend, self.request_deadline()))
+        retrieval_mode = None if query_embedding is not None else "lexical"
+        recommendations = await loop.run_in_executor(self.cpu_pool, run_in_context(
+            get_recommendations, query_embedding=query_embedding, retrieval_mode=retrieval_mode))
+        if query_embedding is None:
+            self.record_path(trace, "lexical", degraded=self.vector_failed(snapshot))
+        return recommendations
+
+    def allowed_assessments(self, filters: Optional[Dict] = None, limit: Optional[int] = None,
+                            snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
+        """Copies of the first `limit` assessments satisfying `filters`, in catalog order."""
+        snapshot = snapshot or self.snapshot
+        mask = snapshot.catalog.filter_mask(filters)
+        if mask is None:
+            indices = np.arange(len(snapshot.assessments))
+        else:
+            indices = np.flatnonzero(mask)
+        return snapshot.catalog.materialize(indices[:limit])
+
+    def hybrid_recommendations(self, query: str, top_k: int,
+                               mask: Optional[np.ndarray] = None,
+                               trace: Optional[Dict] = None,
+                               snapshot: Optional[CatalogSnapshot] = None,
+                               query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        """
+        Fuse the lexical and vector rankings with reciprocal-rank fusion.
+
+        Unless the caller already embedded the query (`query_embedding`, as the
+        async path does on the I/O pool), the vector leg runs on a worker
+        thread while the lexical ranking is computed here. If the vector leg
+        fails or misses the latency budget (settings.HYBRID_BUDGET_MS), the
+        lexical recommendations are returned alone instead of waiting.
+        """
+        snapshot = snapshot or self.snapshot
+        if query_embedding is not None:
+            similarities = self.vector_similarities(query, mask, query_embedding, snapshot)
+            lexical_ranking = self.lexical_ranking(query, mask=mask, snapshot=snapshot)
+            degraded = False
+        else:
+            deadline = time.monotonic() + settings.HYBRID_BUDGET_MS / 1000
+            vector_future = self.io_pool.submit(
+                run_in_context(self.vector_similarities, query, mask, None, snapshot, deadline))
+            lexical_ranking = self.lexical_ranking(query, mask=mask, snapshot=snapshot)
+
+            try:
+                similarities = vector_future.result(timeout=max(0.0, deadline - time.monotonic()))
+                degraded = similarities is None and self.vector_failed(snapshot)
+            except FutureTimeout:
+                print("Vector leg missed the latency budget, serving lexical ranking")
+                similarities, degraded = None, True
+            except Exception as e:
+                print(f"Error in vector leg: {e}")
+                similarities, degraded = None, True
+
+        if similarities is None:
+            self.record_path(trace, "lexical", degraded=degraded)
+            return self.lexical_recommendations(query, top_k, mask=mask, snapshot=snapshot)
+
+        self.record_path(trace, "hybrid")
+        depth = settings.HYBRID_DEPTH
+        vector_ranking = self.top_candidates(similarities, depth)
+        lexical_ranking = np.asarray(lexical_ranking[:depth], dtype=np.intp)
+
+        fused = np.zeros(len(snapshot.assessments), dtype=np.float32)
+        k = settings.RRF_K
+        fused[lexical_ranking] += settings.HYBRID_LEXICAL_WEIGHT / (k + np.arange(1, len(lexical_ranking) + 1))
+        fused[vector_ranking] += settings.HYBRID_VECTOR_WEIGHT / (k + np.arange(1, len(vector_ranking) + 1))
+        if mask is not None:
+            fused[~mask] = -np.inf
+
+        top_indices = self.top_candidates(fused, top_k * 2)
+        recommendations = self.balance_recommendations(top_indices, fused, query, top_k, snapshot)
+        return recommendations[:top_k]
     
+    @STAGE_SECONDS.timed("score")
+    def score_query(self, index: EmbeddingIndex, query_embedding: List[float],
+                    mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of the query against every assessment, computed as a
+        single matrix-vector product over the pre-normalized index. With a
+        `mask` only the allowed rows are scored, exactly; otherwise an ANN index,
+        if any, scores only the probed cells. Everything else gets -inf.
+        """
+        query_vec = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vec)
+        if norm > 0:
+            query_vec = query_vec / norm
+        # Probing first would leave out allowed rows in unprobed cells
+        if index.ann is not None and mask is None:
+            ids, scores = index.ann.probe(index.matrix, query_vec, settings.ANN_NPROBE)
+            similarities = np.full(len(index.matrix), -np.inf, dtype=np.float32)
+            similarities[ids] = scores
+        elif mask is not None:
+            allowed = np.flatnonzero(mask)
+            similarities = np.full(len(index.matrix), -np.inf, dtype=np.float32)
+            similarities[allowed] = index.matrix[allowed] @ query_vec
+        else:
+            similarities = index.matrix @ query_vec
+        if index.missing:
+            similarities[index.missing] = -np.inf
+        return similarities
+
+    def top_candidates(self, scores: np.ndarray, count: int) -> np.ndarray:
+        """
+        Indices of the `count` highest scores, best first, without a full sort.
+        Items scored -inf (filtered out or unscored) are never returned.
+        """
+        count = min(count, len(scores))
+        if count <= 0:
+            return np.array([], dtype=np.intp)
+        if count < len(scores):
+            top = np.argpartition(-scores, count - 1)[:count]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return top[scores[top] > -np.inf]
+
+    @STAGE_SECONDS.timed("balance")
     def balance_recommendations(self, indices: List[int], similarities: np.ndarray, 
-                                query: str, top_k: int) -> List[Dict]:
+                                query: str, top_k: int,
+                                snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
         """
         Balance recommendations across different test types.
         E.g., if query mentions both technical and behavioral aspects,
@@ -126,193 +1115,136 @@ class AssessmentRecommender:
                            ['cognitive', 'reasoning', 'aptitude', 'numerical', 'verbal'])
         has_sales = any(kw in query_lower for kw in ['sales', 'customer', 'marketing'])
         
-        # Categorize candidates
-        technical_recs = []
-        behavioral_recs = []
-        cognitive_recs = []
-        sales_recs = []
-        other_recs = []
-        
-        for idx in indices:
-            assessment = self.assessments[idx].copy()
-            assessment['_score'] = float(similarities[idx])
-            
-            test_types = ' '.join(assessment.get('test_type', [])).lower()
-            
-            if 'knowledge' in test_types or 'skills' in test_types:
-                technical_recs.append(assessment)
-            elif 'personality' in test_types or 'behavior' in test_types:
-                behavioral_recs.append(assessment)
-            elif 'ability' in test_types or 'aptitude' in test_types:
-                cognitive_recs.append(assessment)
-            elif 'competencies' in test_types:
-                if 'sales' in assessment.get('name', '').lower():
-                    sales_recs.append(assessment)
-                else:
-                    other_recs.append(assessment)
-            else:
-                other_recs.append(assessment)
+        # Categorize candidates, keeping their ranked order
+        catalog = (snapshot or self.snapshot).catalog
+        indices = np.asarray(indices, dtype=np.intp)
+        categories = catalog.category[indices]
+        technical_recs = indices[categories == TECHNICAL]
+        behavioral_recs = indices[categories == BEHAVIORAL]
+        cognitive_recs = indices[categories == COGNITIVE]
+        sales_recs = indices[categories == SALES]
+        other_recs = indices[categories == OTHER]
         
         # Build balanced result
-        balanced_results = []
-        
         if has_technical and has_behavioral:
             # Mix technical and behavioral
             target_technical = top_k // 2
             target_behavioral = top_k - target_technical
-            balanced_results.extend(technical_recs[:target_technical])
-            balanced_results.extend(behavioral_recs[:target_behavioral])
+            parts = [technical_recs[:target_technical], behavioral_recs[:target_behavioral]]
         elif has_technical:
             # Mostly technical with some cognitive
-            balanced_results.extend(technical_recs[:top_k - 2])
-            balanced_results.extend(cognitive_recs[:2])
+            parts = [technical_recs[:top_k - 2], cognitive_recs[:2]]
         elif has_behavioral:
             # Mostly behavioral
-            balanced_results.extend(behavioral_recs[:top_k - 2])
-            balanced_results.extend(cognitive_recs[:2])
+            parts = [behavioral_recs[:top_k - 2], cognitive_recs[:2]]
         elif has_sales:
             # Sales focused
-            balanced_results.extend(sales_recs[:top_k - 2])
-            balanced_results.extend(behavioral_recs[:2])
+            parts = [sales_recs[:top_k - 2], behavioral_recs[:2]]
         else:
             # General mix
-            balanced_results.extend(technical_recs[:3])
-            balanced_results.extend(behavioral_recs[:3])
-            balanced_results.extend(cognitive_recs[:2])
-            balanced_results.extend(other_recs[:2])
+            parts = [technical_recs[:3], behavioral_recs[:3], cognitive_recs[:2], other_recs[:2]]
+        selected = np.concatenate(parts)
         
-        # Fill remaining slots with highest scoring
-        if len(balanced_results) < top_k:
-            remaining = [self.assessments[i].copy() for i in indices 
-                        if self.assessments[i] not in balanced_results]
-            balanced_results.extend(remaining[:top_k - len(balanced_results)])
+        # Fill remaining slots with the highest scoring candidates not yet chosen
+        if len(selected) < top_k:
+            chosen_urls = catalog.url_id[selected]
+            remaining = indices[~np.isin(catalog.url_id[indices], chosen_urls)]
+            selected = np.concatenate([selected, remaining[:top_k - len(selected)]])
         
-        # Remove duplicates while preserving order
-        seen_urls = set()
-        unique_results = []
-        for rec in balanced_results:
-            if rec['url'] not in seen_urls:
-                seen_urls.add(rec['url'])
-                unique_results.append(rec)
+        # Remove duplicate URLs while preserving order
+        _, first = np.unique(catalog.url_id[selected], return_index=True)
+        selected = selected[np.sort(first)]
         
-        return unique_results
+        return catalog.materialize(selected, similarities)
     
-    def keyword_based_recommendations(self, query: str, top_k: int) -> List[Dict]:
+    @STAGE_SECONDS.timed("lexical")
+    def lexical_recommendations(self, query: str, top_k: int, engine: Optional[str] = None,
+                                mask: Optional[np.ndarray] = None,
+                                snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
+        """
+        Recommendations that need no embedding API, using `engine`
+        ("keyword" or "bm25", defaulting to settings.LEXICAL_ENGINE).
+        """
+        snapshot = snapshot or self.snapshot
+        engine = engine or settings.LEXICAL_ENGINE
+        if engine == "bm25" and snapshot.bm25_index is not None:
+            return self.bm25_recommendations(query, top_k, mask, snapshot)
+        return self.keyword_based_recommendations(query, top_k, mask, snapshot)
+
+    def lexical_ranking(self, query: str, engine: Optional[str] = None,
+                        mask: Optional[np.ndarray] = None,
+                        snapshot: Optional[CatalogSnapshot] = None) -> List[int]:
+        """
+        Indices of assessments matching the query, best first, from the
+        lexical engine. Assessments with no match or outside `mask` are left out.
+        """
+        snapshot = snapshot or self.snapshot
+        engine = engine or settings.LEXICAL_ENGINE
+        if engine == "bm25" and snapshot.bm25_index is not None:
+            scores = self.bm25_scores(query, mask, snapshot)
+            ranked = self.top_candidates(scores, int(np.count_nonzero(scores > 0)))
+            return ranked.tolist()
+        scores = self.keyword_scores(query, mask, snapshot)
+        return sorted(scores, key=lambda idx: (-scores[idx], idx))
+
+    def bm25_scores(self, query: str, mask: Optional[np.ndarray] = None,
+                    snapshot: Optional[CatalogSnapshot] = None) -> np.ndarray:
+        """BM25 scores, with assessments outside `mask` set to -inf."""
+        scores = (snapshot or self.snapshot).bm25_index.score(query)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        return scores
+
+    def keyword_scores(self, query: str, mask: Optional[np.ndarray] = None,
+                       snapshot: Optional[CatalogSnapshot] = None) -> Dict[int, int]:
+        """Positive keyword scores by catalog index, restricted to `mask`."""
+        keyword_index = (snapshot or self.snapshot).keyword_index
+        scores = keyword_index.score(query) if keyword_index else {}
+        if mask is not None:
+            scores = {idx: score for idx, score in scores.items() if mask[idx]}
+        return scores
+
+    def bm25_recommendations(self, query: str, top_k: int,
+                             mask: Optional[np.ndarray] = None,
+                             snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
+        """
+        BM25-ranked recommendations, balanced across test types like the vector path.
+        """
+        scores = self.bm25_scores(query, mask, snapshot)
+        top_indices = self.top_candidates(scores, top_k * 2)
+        recommendations = self.balance_recommendations(top_indices, scores, query, top_k, snapshot)
+        return recommendations[:top_k]
+
+    def keyword_based_recommendations(self, query: str, top_k: int,
+                                      mask: Optional[np.ndarray] = None,
+                                      snapshot: Optional[CatalogSnapshot] = None) -> List[Dict]:
         """
         Fallback keyword-based recommendation when embeddings fail.
         Enhanced with better scoring and relevance matching.
         """
-        query_lower = query.lower()
-        query_words = set(query_lower.split())
-        
-        # Extract key technical terms
-        tech_keywords = {'java', 'python', 'sql', 'javascript', 'css', 'html', 'selenium', 
-                        'excel', 'tableau', 'data', 'analyst', 'developer', 'engineer',
-                        'testing', 'qa', 'selenium', 'automation', 'programming'}
-        
-        # Extract behavioral keywords
-        behavioral_keywords = {'leadership', 'communication', 'personality', 'behavioral',
-                              'collaborate', 'team', 'management', 'cultural', 'fit',
-                              'interpersonal', 'sales', 'customer', 'service'}
-        
-        # Extract role keywords
-        role_keywords = {'senior', 'junior', 'entry', 'level', 'manager', 'director',
-                        'executive', 'analyst', 'consultant', 'admin', 'assistant'}
+        assessments = (snapshot or self.snapshot).assessments
+        scores = self.keyword_scores(query, mask, snapshot)
         
+        # Sort by score, ties in catalog order
+        ranked = sorted(scores, key=lambda idx: (-scores[idx], idx))
         scored_assessments = []
-        
-        for assessment in self.assessments:
-            text = self.create_assessment_text(assessment).lower()
-            text_words = set(text.split())
-            name_lower = assessment.get('name', '').lower()
-            desc_lower = assessment.get('description', '').lower()
-            
-            # Calculate base overlap score
-            overlap = len(query_words & text_words)
-            score = overlap
-            
-            # Boost for technical keyword matches
-            tech_matches = query_words & tech_keywords
-            for keyword in tech_matches:
-                if keyword in name_lower:
-                    score += 5
-                elif keyword in desc_lower:
-                    score += 3
-                elif keyword in text:
-                    score += 1
-            
-            # Boost for behavioral keyword matches
-            behavioral_matches = query_words & behavioral_keywords
-            for keyword in behavioral_matches:
-                if keyword in name_lower:
-                    score += 4
-                elif keyword in desc_lower:
-                    score += 2
-                elif keyword in text:
-                    score += 1
-            
-            # Boost for role matches
-            role_matches = query_words & role_keywords
-            for keyword in role_matches:
-                if keyword in name_lower or keyword in desc_lower:
-                    score += 2
-            
-            # Extract duration from query
-            duration_match = None
-            import re
-            duration_patterns = [
-                r'(\d+)\s*(?:minutes?|mins?)',
-                r'(\d+)\s*(?:hours?|hrs?)',
-                r'(\d+)-(\d+)\s*(?:minutes?|mins?|hours?|hrs?)'
-            ]
-            for pattern in duration_patterns:
-                matches = re.findall(pattern, query_lower)
-                if matches:
-                    if isinstance(matches[0], tuple):
-                        duration_match = int(matches[0][0])
-                    else:
-                        duration_match = int(matches[0])
-                    if 'hour' in pattern:
-                        duration_match *= 60
-                    break
-            
-            # Boost for duration match (within reasonable range)
-            if duration_match:
-                assessment_duration = assessment.get('duration', 60)
-                duration_diff = abs(assessment_duration - duration_match)
-                if duration_diff <= 15:  # Within 15 minutes
-                    score += 3
-                elif duration_diff <= 30:  # Within 30 minutes
-                    score += 1
-            
-            # Boost for test type match
-            test_types = ' '.join(assessment.get('test_type', [])).lower()
-            if 'knowledge' in query_lower or 'skill' in query_lower or 'technical' in query_lower:
-                if 'knowledge' in test_types or 'skill' in test_types:
-                    score += 3
-            if 'personality' in query_lower or 'behavioral' in query_lower or 'culture' in query_lower:
-                if 'personality' in test_types or 'behavior' in test_types:
-                    score += 3
-            if 'cognitive' in query_lower or 'aptitude' in query_lower:
-                if 'ability' in test_types or 'aptitude' in test_types:
-                    score += 3
-            
-            if score > 0:
-                assessment_copy = assessment.copy()
-                assessment_copy['_score'] = score
-                scored_assessments.append(assessment_copy)
-        
-        # Sort by score
-        scored_assessments.sort(key=lambda x: x['_score'], reverse=True)
+        for idx in ranked:
+            assessment_copy = assessments[idx].copy()
+            assessment_copy['_score'] = scores[idx]
+            assessment_copy['_index'] = idx
+            scored_assessments.append(assessment_copy)
         
         # Ensure we have at least top_k results
-        if len(scored_assessments) < top_k and len(self.assessments) > 0:
+        if len(scored_assessments) < top_k and len(assessments) > 0:
             # Add remaining assessments with low score
             existing_urls = {a['url'] for a in scored_assessments}
-            for assessment in self.assessments:
+            for idx, assessment in enumerate(assessments):
+                if mask is not None and not mask[idx]:
+                    continue
                 if assessment['url'] not in existing_urls:
                     assessment_copy = assessment.copy()
                     assessment_copy['_score'] = 0
+                    assessment_copy['_index'] = idx
                     scored_assessments.append(assessment_copy)
                     if len(scored_assessments) >= top_k:
                         break
@@ -335,3 +1267,39 @@ class AssessmentRecommender:
                 "test_type": rec.get('test_type', [])
             })
         return formatted
+
+    def render_fragment(self, assessment: Dict) -> bytes:
+        """Validated AssessmentResponse JSON for one assessment."""
+        formatted = self.format_response([assessment])[0]
+        return AssessmentResponse(**formatted).model_dump_json().encode('utf-8')
+
+    def render_fragments(self, assessments: List[Dict]) -> List[Optional[bytes]]:
+        """
+        Pre-render every assessment's response JSON once per catalog load.
+        Assessments that fail validation get None and are rendered per request,
+        so the error surfaces only for requests that select them, as before.
+        """
+        fragments = []
+        for assessment in assessments:
+            try:
+                fragments.append(self.render_fragment(assessment))
+            except ValueError as e:
+                print(f"Warning: Could not pre-render {assessment.get('url', '')}: {e}")
+                fragments.append(None)
+        return fragments
+
+    @STAGE_SECONDS.timed("format")
+    def render_response(self, recommendations: List[Dict],
+                        snapshot: Optional[CatalogSnapshot] = None) -> bytes:
+        """
+        RecommendationResponse JSON for `recommendations`, concatenated from the
+        pre-rendered fragments of the selected assessments. The bytes match
+        what FastAPI would produce for the equivalent response model.
+        """
+        fragments = (snapshot or self.snapshot).fragments
+        parts = []
+        for rec in recommendations:
+            idx = rec.get('_index')
+            fragment = fragments[idx] if idx is not None else None
+            parts.append(fragment if fragment is not None else self.render_fragment(rec))
+        return b'{"recommended_assessments":[' + b','.join(parts) + b']}'
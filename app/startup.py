@@ -0,0 +1,44 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started, read from /proc (Linux only)."""
+    try:
+        with open('/proc/self/stat') as f:
+            stat = f.read()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError):
+        return None
+    # Field 22 (starttime, in clock ticks after boot); the command name in
+    # field 2 may contain spaces, so count from its closing parenthesis
+    start_ticks = int(stat.rsplit(')', 1)[1].split()[19])
+    return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+
+
+class StartupTimer:
+    """
+    Durations of the cold-start phases in seconds, for the startup report.
+    Phases that run in the background (e.g. the embedding index) are added
+    when they finish.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = round(seconds, 4)
+
+    def report(self) -> str:
+        return ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self.phases.items())
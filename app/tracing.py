@@ -0,0 +1,89 @@
+import contextlib
+import contextvars
+import hashlib
+import random
+from typing import Dict, Optional
+
+from app.cache import normalize_query
+from app.config import settings
+
+# Trace of the request being served: the retrieval path (see
+# AssessmentRecommender.record_path) and seconds spent per stage. Work handed
+# to thread pools must run in a copy of the request's context (run_in_context)
+# for its stages to be recorded.
+REQUEST_TRACE: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def start_trace(enabled: bool = True) -> Optional[Dict]:
+    """Start tracing the current request and return its trace (None if not `enabled`)."""
+    trace = {"stages": {}} if enabled else None
+    REQUEST_TRACE.set(trace)
+    return trace
+
+
+def record_stage(stage: str, seconds: float):
+    """Add `seconds` to `stage` in the current request's trace, if it is traced."""
+    trace = REQUEST_TRACE.get()
+    if trace is not None:
+        stages = trace["stages"]
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def collect_stages(trace: Dict):
+    """
+    Record stages into `trace` instead of the current request's trace within
+    the block, for work that may be shared between requests (single flight).
+    Each request then adds it to its own trace with merge_trace.
+    """
+    token = REQUEST_TRACE.set(trace)
+    try:
+        yield trace
+    finally:
+        REQUEST_TRACE.reset(token)
+
+
+def merge_trace(trace: Dict, computed: Dict):
+    """Add the stages and retrieval path of a shared computation to a request's `trace`."""
+    stages = trace.setdefault("stages", {})
+    for key, value in computed.items():
+        if key == "stages":
+            for stage, seconds in value.items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        else:
+            trace[key] = value
+
+
+def run_in_context(fn, *args, **kwargs):
+    """A callable running `fn` in a copy of the current context, for thread pools."""
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args, **kwargs)
+
+
+def server_timing(trace: Dict, total: float) -> str:
+    """Server-Timing header value for a request trace, in milliseconds."""
+    metrics = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in trace["stages"].items()]
+    metrics.append(f"total;dur={total * 1000:.2f}")
+    if trace.get("cache"):
+        metrics.append(f'cache;desc="{trace["cache"]}"')
+    if trace.get("path"):
+        path = trace["path"] + (" degraded" if trace.get("degraded") else "")
+        metrics.append(f'path;desc="{path}"')
+    return ", ".join(metrics)
+
+
+def query_hash(query: str) -> str:
+    """Short hash identifying a query in logs without recording its text."""
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()[:12]
+
+
+def log_if_slow(query: str, trace: Dict, total: float):
+    """
+    Log a sample (settings.SLOW_REQUEST_SAMPLE_RATE) of the requests slower
+    than settings.SLOW_REQUEST_MS with their stage breakdown.
+    """
+    if settings.SLOW_REQUEST_MS <= 0 or total * 1000 < settings.SLOW_REQUEST_MS:
+        return
+    if random.random() >= settings.SLOW_REQUEST_SAMPLE_RATE:
+        return
+    print(f"Slow request: {total * 1000:.1f}ms query={query_hash(query)} {server_timing(trace, total)}")
@@ -0,0 +1,97 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ann import IVFIndex
+from app.config import settings
+from app.recommender import AssessmentRecommender, EmbeddingIndex
+
+
+def synthetic_vectors(n, dim, clusters, rng):
+    """
+    L2-normalized vectors drawn around random cluster centres, which is closer
+    to real embedding distributions than uniform noise.
+    """
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    chunk = 100000
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        labels = rng.integers(clusters, size=size)
+        vectors[start:start + size] = centres[labels] + 0.6 * rng.standard_normal((size, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def served_search(recommender, index, query, k):
+    """Top-k ids as /recommend computes them: score_query, then top_candidates."""
+    return recommender.top_candidates(recommender.score_query(index, query), k)
+
+
+def percentiles(latencies):
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def benchmark_size(recommender, n, dim, queries, nprobes, k, rng):
+    matrix = synthetic_vectors(n, dim, clusters=max(16, n // 1000), rng=rng)
+    query_vectors = synthetic_vectors(queries, dim, clusters=16, rng=rng)
+    # Queries near catalog items, like real job descriptions near assessments
+    query_vectors = matrix[rng.integers(n, size=queries)] + 0.3 * query_vectors
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    ann = IVFIndex.build(matrix)
+    build_s = time.perf_counter() - start
+    exact_index = EmbeddingIndex(matrix, [])
+    ann_index = EmbeddingIndex(matrix, [], ann)
+
+    exact = []
+    latencies = []
+    for query in query_vectors:
+        start = time.perf_counter()
+        exact.append(set(served_search(recommender, exact_index, query, k).tolist()))
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p99 = percentiles(latencies)
+
+    print(f"\nN={n:,} dim={dim} nlist={ann.nlist} build={build_s:.1f}s")
+    print(f"{'Search':<14} {'Recall@' + str(k):>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    print(f"{'exact':<14} {1.0:>10.4f} {p50:>10.3f} {p99:>10.3f}")
+
+    for nprobe in nprobes:
+        settings.ANN_NPROBE = nprobe
+        recalls = []
+        latencies = []
+        for query, truth in zip(query_vectors, exact):
+            start = time.perf_counter()
+            ids = served_search(recommender, ann_index, query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(truth & set(ids.tolist())) / k)
+        p50, p99 = percentiles(latencies)
+        print(f"{'ivf nprobe=' + str(nprobe):<14} {np.mean(recalls):>10.4f} {p50:>10.3f} {p99:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the IVF index against exact search, timing the path /recommend serves")
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="comma-separated catalog sizes")
+    parser.add_argument('--dim', type=int, default=768, help="vector dimensionality")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nprobe', default='1,4,8,16,32', help="comma-separated nprobe values")
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    nprobes = [int(p) for p in args.nprobe.split(',')]
+    recommender = AssessmentRecommender(load=False)
+    for n in (int(s) for s in args.sizes.split(',')):
+        benchmark_size(recommender, n, args.dim, args.queries, nprobes, args.k, rng)
+
+
+if __name__ == "__main__":
+    main()
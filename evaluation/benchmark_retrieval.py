@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.embeddings import EmbeddingBackend
+from app.recommender import AssessmentRecommender
+from app.config import settings
+from evaluation.evaluate import calculate_recall_at_k
+
+ENGINES = ['keyword', 'bm25']
+
+
+def benchmark_engine(recommender, engine, query_groups, repeats=5):
+    """
+    Mean Recall@10 and per-query latency of one lexical engine on the training set.
+    """
+    # Untimed warm-up: indexes such as BM25 are fitted on first use
+    recommender.lexical_recommendations(next(iter(query_groups)), 10, engine=engine)
+    recalls = []
+    latencies = []
+    for query, relevant_urls in query_groups.items():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            recommendations = recommender.lexical_recommendations(query, 10, engine=engine)
+            latencies.append((time.perf_counter() - start) * 1000)
+        recommended_urls = [rec['url'] for rec in recommendations]
+        recalls.append(calculate_recall_at_k(relevant_urls, recommended_urls, k=10))
+
+    return {
+        'recall': float(np.mean(recalls)),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def replicate_catalog(recommender, factor):
+    """
+    Grow the catalog `factor` times with renamed copies, to measure how
+    scoring latency scales. Recall is meaningless on a replicated catalog.
+    """
+    base = recommender.assessments
+    assessments = [
+        dict(a, url=f"{a['url']}#{copy}", name=f"{a['name']} {copy}")
+        for copy in range(factor) for a in base
+    ]
+    # Only the lexical engines are benchmarked, so no embedding model is needed
+    recommender.snapshot = recommender.build_snapshot(
+        assessments, f"{recommender.snapshot.version}x{factor}", EmbeddingBackend())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the lexical retrieval engines")
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs per query")
+    parser.add_argument('--replicate', type=int, default=1,
+                        help="multiply the catalog size to measure latency at scale")
+    args = parser.parse_args()
+
+    train_df = pd.read_csv(settings.TRAIN_FILE)
+    query_groups = train_df.groupby('Query')['Assessment_url'].apply(list).to_dict()
+
+    recommender = AssessmentRecommender()
+    if args.replicate > 1:
+        replicate_catalog(recommender, args.replicate)
+
+    print(f"\nCatalog size: {len(recommender.assessments)}, queries: {len(query_groups)}")
+    print(f"{'Engine':<10} {'Recall@10':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for engine in ENGINES:
+        result = benchmark_engine(recommender, engine, query_groups, args.repeats)
+        recall = f"{result['recall']:.4f}" if args.replicate == 1 else "-"
+        print(f"{engine:<10} {recall:>10} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
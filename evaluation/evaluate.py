@@ -59,15 +59,18 @@ def evaluate_on_train_set():
     print("Initializing recommender...")
     recommender = AssessmentRecommender()
     
+    # Get recommendations for all queries in one batch
+    queries = list(query_groups)
+    batch = recommender.get_recommendations_batch(queries, top_k=10)
+    
     # Evaluate each query
     results = {}
     
-    for idx, (query, relevant_urls) in enumerate(query_groups.items(), 1):
+    for idx, (query, recommendations) in enumerate(zip(queries, batch), 1):
+        relevant_urls = query_groups[query]
         print(f"\nEvaluating query {idx}/{len(query_groups)}")
         print(f"Query: {query[:100]}...")
         
-        # Get recommendations
-        recommendations = recommender.get_recommendations(query, top_k=10)
         recommended_urls = [rec['url'] for rec in recommendations]
         
         # Calculate recall
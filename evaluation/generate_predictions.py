@@ -23,14 +23,14 @@ def generate_predictions():
     # Store predictions
     predictions = []
     
-    for idx, row in test_df.iterrows():
-        query = row['Query']
+    # Get recommendations for all queries in one batch
+    queries = test_df['Query'].tolist()
+    batch = recommender.get_recommendations_batch(queries, top_k=10)
+    
+    for idx, (query, recommendations) in enumerate(zip(queries, batch)):
         print(f"\nProcessing query {idx + 1}/{len(test_df)}")
         print(f"Query: {query[:100]}...")
         
-        # Get recommendations
-        recommendations = recommender.get_recommendations(query, top_k=10)
-        
         # Add each recommendation as a separate row
         for rec in recommendations:
             predictions.append({
@@ -0,0 +1,80 @@
+import time
+
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def open_breaker(reset_timeout: float = 30.0) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=3, slow_call_seconds=1.0, reset_timeout=reset_timeout)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, slow_call_seconds=1.0, reset_timeout=30.0)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=1.0)
+    breaker.record_failure()
+    breaker.record_success(0.01)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=0.5)
+    breaker.record_success(0.6)
+    breaker.record_success(0.7)
+    assert breaker.state == OPEN
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = open_breaker(reset_timeout=0.05)
+    assert not breaker.allow()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow()
+
+    breaker.record_success(0.01)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_release_frees_the_probe():
+    breaker = open_breaker(reset_timeout=0.05)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_fits_uses_average_latency():
+    breaker = CircuitBreaker(slow_call_seconds=5.0)
+    breaker.record_success(0.2)
+    assert breaker.fits(time.monotonic() + 1.0)
+    assert not breaker.fits(time.monotonic() + 0.1)
+    assert breaker.stats()["skipped"] == 1
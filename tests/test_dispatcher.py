@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.dispatcher import EmbeddingDispatcher
+
+
+class FakeBackend:
+    """Records each embed_queries call; calls block while `gate` is clear."""
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def embed_queries(self, texts, deadline=None):
+        self.calls.append(list(texts))
+        self.gate.wait()
+        if self.fail:
+            raise RuntimeError("upstream error")
+        return {pos: [float(len(text))] for pos, text in enumerate(texts)}
+
+
+def embed_all(dispatcher, backend, texts, deadline=None):
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        return list(pool.map(lambda text: dispatcher.embed(backend, text, deadline), texts))
+
+
+def test_concurrent_queries_share_one_deduplicated_call():
+    dispatcher = EmbeddingDispatcher(window=0.05, max_batch=32)
+    backend = FakeBackend()
+    texts = ["java", "sales", "java", "python developer", "sales"]
+
+    results = embed_all(dispatcher, backend, texts)
+
+    assert results == [[float(len(text))] for text in texts]
+    assert len(backend.calls) == 1
+    assert sorted(backend.calls[0]) == ["java", "python developer", "sales"]
+    assert dispatcher.stats()["batched_queries"] == len(texts)
+
+
+def test_batches_are_capped_at_max_batch():
+    dispatcher = EmbeddingDispatcher(window=0.05, max_batch=4)
+    backend = FakeBackend()
+    texts = [f"query {i}" for i in range(10)]
+
+    results = embed_all(dispatcher, backend, texts)
+
+    assert results == [[float(len(text))] for text in texts]
+    assert all(len(call) <= 4 for call in backend.calls)
+    assert sum(len(call) for call in backend.calls) == 10
+
+
+def test_queries_wait_for_a_free_slot_and_go_out_together():
+    dispatcher = EmbeddingDispatcher(window=0.0, max_batch=32, concurrency=1)
+    backend = FakeBackend()
+    backend.gate.clear()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        first = pool.submit(dispatcher.embed, backend, "first")
+        while not backend.calls:
+            time.sleep(0.001)
+        rest = [pool.submit(dispatcher.embed, backend, f"query {i}") for i in range(5)]
+        time.sleep(0.05)
+        # The only slot is busy, so nothing else has been sent yet
+        assert len(backend.calls) == 1
+        backend.gate.set()
+        assert first.result() == [5.0]
+        assert [future.result() for future in rest] == [[7.0]] * 5
+
+    assert backend.calls[1:] == [[f"query {i}" for i in range(5)]]
+
+
+def test_caller_gives_up_at_its_deadline_without_failing_the_batch():
+    dispatcher = EmbeddingDispatcher(window=0.01, max_batch=32)
+    backend = FakeBackend()
+    backend.gate.clear()
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        patient = pool.submit(dispatcher.embed, backend, "patient")
+        start = time.monotonic()
+        assert dispatcher.embed(backend, "hurried", deadline=start + 0.1) is None
+        assert 0.09 <= time.monotonic() - start < 0.5
+        backend.gate.set()
+        assert patient.result(timeout=1) == [7.0]
+
+
+def test_backend_failure_returns_none_to_every_caller():
+    dispatcher = EmbeddingDispatcher(window=0.02, max_batch=32)
+    backend = FakeBackend(fail=True)
+
+    assert embed_all(dispatcher, backend, ["java", "sales"]) == [None, None]
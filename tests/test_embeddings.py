@@ -0,0 +1,53 @@
+import threading
+import time
+
+from app.circuit_breaker import HALF_OPEN, OPEN
+from app.embeddings import GeminiEmbeddingBackend
+from app.rate_limit import TokenBucket
+
+
+def make_backend(rate: float, burst: float, reset_timeout: float = 30.0) -> GeminiEmbeddingBackend:
+    backend = GeminiEmbeddingBackend()
+    backend.rate_limiter = TokenBucket(rate, burst)
+    backend.breaker.reset_timeout = reset_timeout
+    for _ in range(backend.breaker.failure_threshold):
+        backend.breaker.record_failure()
+    assert backend.breaker.state == OPEN
+    return backend
+
+
+def test_open_breaker_rejects_without_waiting_for_the_rate_limit():
+    # One call per second, and the only token is already taken
+    backend = make_backend(rate=1.0, burst=1)
+    assert backend.rate_limiter.acquire()
+
+    calls = []
+    start = time.monotonic()
+    for _ in range(3):
+        assert backend.guarded(calls.append, deadline=time.monotonic() + 2.0) is None
+    assert time.monotonic() - start < 0.05
+    assert calls == []
+    assert backend.rate_limiter.stats()["throttled"] == 0
+
+
+def test_throttled_probe_is_released():
+    backend = make_backend(rate=1.0, burst=1, reset_timeout=0.0)
+    assert backend.rate_limiter.acquire()
+
+    assert backend.guarded(lambda options: "vector", deadline=time.monotonic() + 0.1) is None
+    assert backend.breaker.state == HALF_OPEN
+    # The next caller can still probe once a token arrives
+    assert backend.guarded(lambda options: "vector") == "vector"
+
+
+def test_hung_call_is_abandoned_at_the_deadline():
+    backend = GeminiEmbeddingBackend()
+    backend.rate_limiter = TokenBucket(0)
+    release = threading.Event()
+
+    start = time.monotonic()
+    assert backend.guarded(lambda options: release.wait(), deadline=start + 0.1) is None
+    assert time.monotonic() - start < 0.3
+    # Counted when the deadline passed, not when the call returns
+    assert backend.breaker.failures == 1
+    release.set()
@@ -0,0 +1,39 @@
+import time
+
+from app.rate_limit import TokenBucket
+
+
+def test_burst_is_immediate_then_calls_wait():
+    bucket = TokenBucket(rate=20.0, burst=2)
+    start = time.monotonic()
+    assert bucket.acquire()
+    assert bucket.acquire()
+    assert time.monotonic() - start < 0.02
+
+    assert bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_refuses_without_waiting_past_deadline():
+    bucket = TokenBucket(rate=1.0, burst=1)
+    assert bucket.acquire()
+
+    start = time.monotonic()
+    assert not bucket.acquire(deadline=start + 0.1)
+    assert time.monotonic() - start < 0.02
+    assert bucket.stats()["throttled"] == 1
+
+
+def test_refused_call_takes_no_token():
+    bucket = TokenBucket(rate=10.0, burst=1)
+    assert bucket.acquire()
+    assert not bucket.acquire(deadline=time.monotonic())
+    # The next token is due in 0.1s, not 0.2s
+    start = time.monotonic()
+    assert bucket.acquire(deadline=start + 0.15)
+    assert time.monotonic() - start < 0.15
+
+
+def test_zero_rate_disables_limit():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.acquire(deadline=time.monotonic()) for _ in range(100))